@@ -0,0 +1,7 @@
+"""
+asv benchmarks for fitting, prediction and plotting.
+
+Install the ``bench`` extra and run ``asv run`` from the repository root, or
+``asv run --python=same`` to benchmark the current environment. ``peakmem_``
+benchmarks record the peak memory of the process.
+"""
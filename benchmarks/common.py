@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from usopp import FourierSeasonality, LinearTrend, LogisticGrowth, RBFSeasonality, Regressor
+from usopp.utils import (
+    Posterior, get_posterior, logistic_growth_data, regressor_data, seasonal_data, trend_data
+)
+
+COMPONENTS = ["linear_trend", "logistic_growth", "fourier", "rbf", "regressor"]
+POOL_TYPES = ["complete", "unpooled", "partial"]
+
+
+def make_data(component, size, n_obs, n_groups=1):
+    """
+    Returns ``X, y`` with ``n_groups`` series of ``n_obs`` rows generated for
+    ``component``, with the series in a categorical ``group`` column.
+    """
+    np.random.seed(0)
+    frames = []
+    for i in range(n_groups):
+        if component == "linear_trend":
+            data, _ = trend_data(size, n_obs=n_obs)
+        elif component == "logistic_growth":
+            data, _ = logistic_growth_data(size, n_obs=n_obs)
+        elif component == "regressor":
+            data, _ = regressor_data(size, n_obs=n_obs)
+        else:
+            data, _ = seasonal_data(5, n_obs=n_obs)
+        data["group"] = f"group{i}"
+        frames.append(data)
+    data = pd.concat(frames).sort_values("t", kind="stable").reset_index(drop=True)
+    data["group"] = data["group"].astype("category")
+    return data.drop(columns=["value"]), data["value"]
+
+
+def make_model(component, size, pool_type="complete"):
+    pool = {"pool_type": pool_type, "pool_cols": None if pool_type == "complete" else "group"}
+    if component == "linear_trend":
+        return LinearTrend(n_changepoints=size, **pool)
+    if component == "logistic_growth":
+        return LogisticGrowth(capacity=1., n_changepoints=size, **pool)
+    if component == "fourier":
+        return FourierSeasonality(n=size, **pool)
+    if component == "rbf":
+        return RBFSeasonality(n_peaks=size, **pool)
+    if component == "regressor":
+        return Regressor(on=[f"feature{i}" for i in range(size)], **pool)
+    raise ValueError(f"unknown component {component}")
+
+
+def with_draws(model, n_draws):
+    """Replaces the MAP trace of ``model`` with ``n_draws`` perturbed copies of it."""
+    rng = np.random.default_rng(0)
+    model.trace_ = Posterior({
+        name: values + rng.normal(scale=0.01, size=(n_draws, *values.shape[1:]))
+        for name, values in ((name, get_posterior(model.trace_, name)) for name in model._trace_names())
+    })
+    return model
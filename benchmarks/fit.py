@@ -0,0 +1,126 @@
+from usopp import RBFSeasonality, fit_many, fit_stacked
+
+from .common import COMPONENTS, POOL_TYPES, make_data, make_model
+
+
+class FitMAP:
+    params = (COMPONENTS, [5, 50], [1_000, 10_000])
+    param_names = ["component", "size", "n_obs"]
+    timeout = 300
+
+    def setup(self, component, size, n_obs):
+        self.X, self.y = make_data(component, size, n_obs)
+        self.X = self.X.drop(columns=["group"])
+
+    def time_fit(self, component, size, n_obs):
+        make_model(component, size).fit(self.X, self.y, progressbar=False)
+
+    def peakmem_fit(self, component, size, n_obs):
+        make_model(component, size).fit(self.X, self.y, progressbar=False)
+
+
+class FitMAPGroups:
+    params = (COMPONENTS, POOL_TYPES, [10, 100])
+    param_names = ["component", "pool_type", "n_groups"]
+    timeout = 600
+
+    def setup(self, component, pool_type, n_groups):
+        self.X, self.y = make_data(component, 5, 500, n_groups)
+
+    def time_fit(self, component, pool_type, n_groups):
+        make_model(component, 5, pool_type).fit(self.X, self.y, progressbar=False)
+
+    def peakmem_fit(self, component, pool_type, n_groups):
+        make_model(component, 5, pool_type).fit(self.X, self.y, progressbar=False)
+
+
+class FitMCMC:
+    params = (COMPONENTS, POOL_TYPES)
+    param_names = ["component", "pool_type"]
+    timeout = 900
+    number = 1
+    repeat = 1
+
+    def setup(self, component, pool_type):
+        self.X, self.y = make_data(component, 5, 500, 5)
+
+    def time_fit(self, component, pool_type):
+        make_model(component, 5, pool_type).fit(
+            self.X, self.y, use_mcmc=True, draws=200, tune=200, chains=2, cores=1, progressbar=False,
+        )
+
+
+class FitADVI:
+    params = (COMPONENTS, POOL_TYPES)
+    param_names = ["component", "pool_type"]
+    timeout = 600
+    number = 1
+    repeat = 1
+
+    def setup(self, component, pool_type):
+        self.X, self.y = make_data(component, 5, 500, 5)
+
+    def time_fit(self, component, pool_type):
+        make_model(component, 5, pool_type).fit(
+            self.X, self.y, method="advi", n=5_000, draws=200, progressbar=False,
+        )
+
+
+class FitADVIMinibatch:
+    params = ([None, 256], [1_000, 10_000])
+    param_names = ["batch_size", "n_obs"]
+    timeout = 600
+    number = 1
+    repeat = 1
+
+    def setup(self, batch_size, n_obs):
+        self.X, self.y = make_data("linear_trend", 5, n_obs)
+        self.X = self.X.drop(columns=["group"])
+
+    def time_fit(self, batch_size, n_obs):
+        make_model("linear_trend", 5).fit(
+            self.X, self.y, method="advi", batch_size=batch_size, n=2_000, draws=200, progressbar=False,
+        )
+
+
+class FitManySeries:
+    params = (["fit_many", "fit_stacked"], [10, 50])
+    param_names = ["api", "n_series"]
+    timeout = 900
+    number = 1
+    repeat = 1
+
+    def setup(self, api, n_series):
+        self.X, self.y = make_data("fourier", 5, 200, n_series)
+
+    def time_fit(self, api, n_series):
+        if api == "fit_many":
+            fit_many(make_model("fourier", 5), self.X, self.y, "group", n_workers=1, progressbar=False)
+        else:
+            fit_stacked(make_model("fourier", 5), self.X, self.y, "group", progressbar=False)
+
+
+class FitRBFManyPeaks:
+    params = ([None, 4], [20, 200])
+    param_names = ["truncate", "n_peaks"]
+    timeout = 600
+
+    def setup(self, truncate, n_peaks):
+        self.X, self.y = make_data("rbf", 5, 20_000)
+        self.X = self.X.drop(columns=["group"])
+
+    def time_fit(self, truncate, n_peaks):
+        RBFSeasonality(n_peaks=n_peaks, sigma=0.02 / n_peaks, truncate=truncate).fit(self.X, self.y, progressbar=False)
+
+
+class Refit:
+    params = (COMPONENTS,)
+    param_names = ["component"]
+
+    def setup(self, component):
+        self.X, self.y = make_data(component, 5, 1_000)
+        self.model = make_model(component, 5, "unpooled")
+        self.model.fit(self.X, self.y, progressbar=False)
+
+    def time_refit(self, component):
+        self.model.refit(self.X, self.y * 1.1)
@@ -0,0 +1,6 @@
+def timeraw_import_usopp():
+    return "import usopp"
+
+
+def timeraw_load_model():
+    return "from usopp.serialization import load_model"
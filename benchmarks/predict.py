@@ -0,0 +1,68 @@
+from .common import COMPONENTS, make_data, make_model, with_draws
+
+
+class Predict:
+    params = (COMPONENTS, [10_000, 100_000], [1, 1_000], [1, 100])
+    param_names = ["component", "n_obs", "n_draws", "n_groups"]
+    timeout = 600
+
+    def setup(self, component, n_obs, n_draws, n_groups):
+        X, y = make_data(component, 5, 200, n_groups)
+        model = make_model(component, 5, "complete" if n_groups == 1 else "unpooled")
+        model.fit(X, y, progressbar=False)
+        self.model = with_draws(model, n_draws)
+        self.X, _ = make_data(component, 5, n_obs // n_groups, n_groups)
+        self.X_scaled = self.model._scale(self.X)
+
+    def time_predict(self, component, n_obs, n_draws, n_groups):
+        self.model.predict(self.X, ci_percentiles=[5, 95])
+
+    def peakmem_predict(self, component, n_obs, n_draws, n_groups):
+        self.model.predict(self.X, ci_percentiles=[5, 95])
+
+    def time_component_predict(self, component, n_obs, n_draws, n_groups):
+        self.model._predict(self.model.trace_, self.X_scaled)
+
+
+class PredictIter:
+    params = ([1, 4],)
+    param_names = ["n_workers"]
+    timeout = 600
+
+    def setup(self, n_workers):
+        X, y = make_data("fourier", 5, 200, 10)
+        model = make_model("fourier", 5, "unpooled")
+        model.fit(X, y, progressbar=False)
+        self.model = with_draws(model, 1_000)
+        self.X, _ = make_data("fourier", 5, 20_000, 10)
+
+    def _chunks(self):
+        return (self.X.iloc[start:start + 20_000] for start in range(0, len(self.X), 20_000))
+
+    def time_predict_iter(self, n_workers):
+        for _ in self.model.predict_iter(self._chunks(), n_workers=n_workers, ci_percentiles=[5, 95]):
+            pass
+
+    def peakmem_predict_iter(self, n_workers):
+        for _ in self.model.predict_iter(self._chunks(), n_workers=n_workers, ci_percentiles=[5, 95]):
+            pass
+
+
+class PlotComponents:
+    # plot_components draws over a time grid, Regressor has no features to plot there
+    params = ([component for component in COMPONENTS if component != "regressor"],)
+    param_names = ["component"]
+
+    def setup(self, component):
+        import matplotlib
+        matplotlib.use("Agg")
+
+        X, y = make_data(component, 5, 1_000, 10)
+        self.model = make_model(component, 5, "unpooled")
+        self.model.fit(X, y, progressbar=False)
+
+    def time_plot_components(self, component):
+        import matplotlib.pyplot as plt
+
+        self.model.plot_components()
+        plt.close("all")
@@ -4,7 +4,9 @@ from setuptools import setup, find_packages
 
 base_packages = ["numpy", "pandas", "pymc"]
 plot_packages = ["matplotlib"]
+parquet_packages = ["pyarrow"]
 dev_packages = ["pytest", "hypothesis", "nbconvert", "jupyter", "ipykernel"]
+bench_packages = ["asv", "virtualenv"]
 docs_packages = [
     "sphinx",
     "myst-nb",
@@ -22,7 +24,9 @@ setup(
     extras_require={
         "dev": dev_packages,
         "plot": plot_packages,
+        "parquet": parquet_packages,
         "docs": docs_packages,
+        "bench": bench_packages,
     },
     description="A hierarchical version of Facebook's Prophet in PyMC3",
     author="Koray Beyaz",
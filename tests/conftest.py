@@ -1,5 +1,7 @@
 import numpy as np
+import pandas as pd
 import pytest
+import xarray as xr
 from usopp import utils
 
 
@@ -54,3 +56,34 @@ def multiplicative_seasonality_data(request):
     n_components, n_changepoints, n_features = request.param
     data = utils.multiplicative_seasonality_data(n_components=5)
     return data, n_components, n_changepoints, n_features
+
+
+@pytest.fixture
+def grouped_trend_data():
+    np.random.seed(42)
+    frames = []
+    for name in ["a", "b", "c"]:
+        data, _ = utils.trend_data(2, noise=0.0001)
+        data["store"] = name
+        frames.append(data)
+    data = pd.concat(frames).sort_values("t", kind="stable").reset_index(drop=True)
+    data["store"] = data["store"].astype("category")
+    return data
+
+
+@pytest.fixture
+def linear_trend_trace():
+    """Returns a function making random MCMC draws for a fitted ``LinearTrend``."""
+    def make_trace(model, n_chains=2, n_draws=50):
+        rng = np.random.default_rng(0)
+        n_groups = len(model.groups_)
+        return xr.Dataset({
+            model._param_name("k"): (("chain", "draw", "k_dim"), rng.normal(size=(n_chains, n_draws, n_groups))),
+            model._param_name("m"): (("chain", "draw", "m_dim"), rng.normal(size=(n_chains, n_draws, n_groups))),
+            model._param_name("delta"): (
+                ("chain", "draw", "delta_dim_0", "delta_dim_1"),
+                rng.normal(size=(n_chains, n_draws, n_groups, model.n_changepoints)),
+            ),
+            "sigma": (("chain", "draw"), rng.uniform(0.1, 1, size=(n_chains, n_draws))),
+        })
+    return make_trace
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usopp import FourierSeasonality, LinearTrend, fit_many, fit_stacked
+from usopp.utils import IdentityScaler, trend_data
+
+
+@pytest.fixture
+def long_data(grouped_trend_data):
+    data = grouped_trend_data.sort_values("store", kind="stable").reset_index(drop=True)
+    store = data.pop("store").astype(str)
+    bad = (store == "c").to_numpy()
+    data["sku"] = np.where(bad, "bad", store)
+    # a decreasing index makes fit raise for this series
+    data.index = np.where(bad, data.index[::-1], data.index)
+    return data
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_fit_many(long_data, n_workers):
+    models, errors = fit_many(
+        LinearTrend(n_changepoints=2), long_data[["t", "sku"]], long_data["value"], "sku",
+        n_workers=n_workers, y_scaler=IdentityScaler, progressbar=False,
+    )
+    assert set(models) == {"a", "b"}
+    assert set(errors) == {"bad"}
+    assert "monotonically increasing" in errors["bad"]
+    for sku, model in models.items():
+        rows = long_data[long_data["sku"] == sku]
+        res = model.predict(rows[["t"]])
+        np.testing.assert_allclose(res.yhat, rows["value"], atol=0.01)
+
+
+def test_fit_many_with_repeated_index_labels():
+    np.random.seed(42)
+    frames = [trend_data(2, noise=0.0001)[0].assign(sku=name) for name in ["a", "b"]]
+    data = pd.concat(frames)
+    assert not data.index.is_unique
+
+    models, errors = fit_many(
+        LinearTrend(n_changepoints=2), data[["t", "sku"]], data["value"], "sku", n_workers=1,
+        y_scaler=IdentityScaler,
+    )
+    assert not errors
+    for sku, frame in zip(["a", "b"], frames):
+        assert models[sku]._model_["y_scaled"].get_value().shape == (len(frame),)
+        np.testing.assert_allclose(models[sku].predict(frame[["t"]]).yhat, frame["value"], atol=0.01)
+
+
+def test_fit_stacked(long_data):
+    data = long_data[long_data["sku"] != "bad"]
+    template = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    model = fit_stacked(template, data[["t", "sku"]], data["value"], "sku", y_scaler=IdentityScaler)
+    assert template.left.pool_type == "complete"
+    assert set(model.left.groups_.values()) == {"a", "b"}
+
+    res = model.predict(data[["t", "sku"]])
+    np.testing.assert_allclose(res.yhat, data["value"], atol=0.01)
+
+
+def test_fit_stacked_estimates_noise_per_series():
+    np.random.seed(42)
+    frames = []
+    for name, noise in [("quiet", 0.0001), ("noisy", 0.1)]:
+        data, _ = trend_data(2, noise=noise)
+        frames.append(data.assign(sku=name))
+    data = pd.concat(frames, ignore_index=True)
+    model = fit_stacked(
+        LinearTrend(n_changepoints=2), data[["t", "sku"]], data["value"], "sku", progressbar=False,
+    )
+    assert model.trace_["sigma"].shape == (2,)
+
+    res = model.predict(data[["t", "sku"]], ci_percentiles=(5, 95), include_noise=True)
+    width = (res["percentile_95"] - res["percentile_5"]).groupby(data["sku"]).mean()
+    assert width["quiet"] < 0.01
+    assert width["noisy"] > 0.1
+
+
+def test_fit_stacked_raises_on_pooled_template(long_data):
+    with pytest.raises(ValueError, match="already pooled"):
+        fit_stacked(
+            LinearTrend(n_changepoints=2, pool_cols="sku", pool_type="partial"),
+            long_data[["t", "sku"]], long_data["value"], "sku",
+        )
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usopp import FourierSeasonality, LinearTrend, RBFSeasonality, Regressor, config
+from usopp.utils import IdentityScaler, get_periodic_peaks, trend_data
+
+
+def test_float_dtype_is_restored():
+    assert config.get_float_dtype() == np.float64
+    with config.float_dtype("float32"):
+        assert config.get_float_dtype() == np.float32
+    assert config.get_float_dtype() == np.float64
+
+
+def test_set_float_dtype_raises_on_non_float():
+    with pytest.raises(ValueError, match="float32 or float64"):
+        config.set_float_dtype("int64")
+
+
+def _fit_predict(data, feature):
+    model = (
+        LinearTrend(n_changepoints=5)
+        + FourierSeasonality(n=4, period=pd.Timedelta(days=7))
+        + RBFSeasonality(peaks=get_periodic_peaks(4), period=pd.Timedelta(days=365.25), sigma=0.05)
+        + Regressor(on=[feature])
+    )
+    model.fit(data[["t", feature]], data["value"], y_scaler=IdentityScaler)
+    return model, model.predict(data[["t", feature]], ci_percentiles=[5, 95])
+
+
+def test_float32_matches_float64():
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.01)
+    data["feature"] = np.random.normal(size=len(data))
+    data["value"] += 0.3 * data["feature"]
+
+    expected_model, expected = _fit_predict(data, "feature")
+    with config.float_dtype("float32"):
+        model, res = _fit_predict(data, "feature")
+        assert model._model_["y_scaled"].dtype == "float32"
+        assert model.left.right._basis(np.array([0.0, 0.5])).dtype == np.float32
+        # same trace, so only the arithmetic of predict differs
+        same_trace = expected_model.predict(data[["t", "feature"]], ci_percentiles=[5, 95])
+    pd.testing.assert_frame_equal(same_trace, expected, atol=1e-5, check_exact=False)
+
+    for name in model._trace_names():
+        assert model.trace_[name].dtype == np.float32
+    # the MAP points differ within the optimizer tolerance, well below the noise
+    pd.testing.assert_frame_equal(res, expected, atol=1e-2, check_exact=False)
+
+    model.refit(data[["t", "feature"]], data["value"])
+    assert model.trace_[model._trace_names()[0]].dtype == np.float32
@@ -13,3 +13,12 @@ def test_can_fit_generated_data(seasonal_data):
     np.testing.assert_allclose(model_beta, true_beta, atol=0.12)
     res = model.predict(data[["t"]])
     np.testing.assert_allclose(res.yhat.squeeze(), data["value"], atol=0.5)
+
+
+def test_basis_matches_direct_evaluation():
+    t = np.arange(24 * 365 * 3) / 100.
+    p, n = 0.24, 30
+    x = 2 * np.pi * (np.arange(n) + 1) * t[:, None] / p
+    expected = np.concatenate((np.cos(x), np.sin(x)), axis=1)
+    np.testing.assert_allclose(FourierSeasonality._X_t(t, p, n), expected, atol=1e-9)
+    np.testing.assert_allclose(FourierSeasonality._X_t(t, p, n, unique_phases=True), expected, atol=1e-9)
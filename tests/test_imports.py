@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import textwrap
+
+from usopp import FourierSeasonality, LinearTrend
+from usopp.serialization import save_model
+from usopp.utils import seasonal_data
+
+HEAVY_MODULES = ["pymc", "pytensor", "scipy", "matplotlib", "xarray", "arviz"]
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)], capture_output=True, text=True, check=True
+    ).stdout
+
+
+def import_times(module):
+    """
+    Returns the self and cumulative import times in seconds of every module imported by
+    ``import module``.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "[us]" not in line:
+            self_us, cumulative_us, name = line.split("|")
+            times[name.strip()] = int(self_us.split(":")[1]) / 1e6, int(cumulative_us) / 1e6
+    return times
+
+
+def test_predicting_saved_model_does_not_import_modeling_stack(tmp_path):
+    data, _ = seasonal_data(3)
+    model = FourierSeasonality(n=3) + LinearTrend(n_changepoints=2)
+    model.fit(data[["t"]], data["value"])
+    save_model(model, tmp_path / "model")
+    data[["t"]].to_pickle(tmp_path / "X.pkl")
+
+    loaded = run_python(f"""
+    import sys
+    import pandas as pd
+    from usopp.serialization import load_model
+
+    model = load_model({str(tmp_path / "model")!r})
+    model.predict(pd.read_pickle({str(tmp_path / "X.pkl")!r}), ci_percentiles=[5, 95])
+    print(" ".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+    """)
+    assert loaded.split() == []
+
+
+def test_import_time():
+    times = import_times("usopp")
+    assert not [name for name in times if name.split(".")[0] in HEAVY_MODULES]
+    # compared with numpy and pandas imported in the same run, so a slow machine slows both
+    own = sum(self_time for name, (self_time, _) in times.items() if name.split(".")[0] == "usopp")
+    assert own < (times["numpy"][1] + times["pandas"][1]) / 2
@@ -1,13 +1,26 @@
 from usopp import LinearTrend
 from usopp.utils import IdentityScaler
 import numpy as np
+import pytest
 
 
-def test_can_fit_generated_data(trend_data):
+@pytest.mark.parametrize("engine", ["dense", "cumsum"])
+def test_can_fit_generated_data(trend_data, engine):
     data, true_delta, n_changepoints = trend_data
-    model = LinearTrend(n_changepoints=n_changepoints)
+    model = LinearTrend(n_changepoints=n_changepoints, engine=engine)
     model.fit(data[['t']], data["value"], y_scaler=IdentityScaler)
     model_delta = np.mean(model.trace_[model._param_name("delta")], axis=0)
     res = model.predict(data[['t']])
     np.testing.assert_allclose(model_delta, true_delta, atol=0.01)
     np.testing.assert_allclose(res.yhat.squeeze(), data.value, atol=0.01)
+
+
+def test_engines_predict_the_same(trend_data):
+    data, _, n_changepoints = trend_data
+    dense = LinearTrend(n_changepoints=n_changepoints)
+    dense.fit(data[['t']], data["value"], y_scaler=IdentityScaler)
+    cumsum = LinearTrend(n_changepoints=n_changepoints, engine="cumsum")
+    cumsum.fit(data[['t']], data["value"], y_scaler=IdentityScaler)
+
+    t = np.linspace(0, 1.5, 500)
+    np.testing.assert_allclose(cumsum._predict(dense.trace_, t, 0), dense._predict(dense.trace_, t, 0))
@@ -12,3 +12,20 @@ def test_can_fit_generated_data(logistic_growth_data):
     res = model.predict(data[["t"]])
     np.testing.assert_allclose(res.yhat.squeeze(), data["value"], atol=1.0)
     np.testing.assert_allclose(model_delta, true_delta, atol=0.01)
+
+
+def test_gamma_matches_recursion():
+    rng = np.random.default_rng(0)
+    n_groups, n_changepoints = 3, 6
+    k = rng.uniform(1, 3, size=n_groups)
+    m = rng.normal(size=n_groups)
+    delta = rng.laplace(scale=0.2, size=(n_groups, n_changepoints))
+    s = np.sort(rng.uniform(size=n_changepoints))
+
+    expected = np.zeros_like(delta)
+    for i in range(n_changepoints):
+        expected[:, i] = (
+            (s[i] - m - expected[:, :i].sum(axis=1)) *
+            (1 - (k + delta[:, :i].sum(axis=1)) / (k + delta[:, :i + 1].sum(axis=1)))
+        )
+    np.testing.assert_allclose(LogisticGrowth._gamma(k, m, delta, s, np), expected)
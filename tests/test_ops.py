@@ -0,0 +1,75 @@
+import numpy as np
+import pytensor
+import pytest
+from pytensor.gradient import verify_grad
+
+import usopp.ops
+from usopp.ops import SegmentDot, SegmentSum, segment_dot
+
+
+@pytest.mark.parametrize("layout", ["shuffled", "sorted", "empty_groups"])
+def test_segment_dot(layout, monkeypatch):
+    monkeypatch.setattr(usopp.ops, "CHUNK_SIZE", 16)
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 4, 50)
+    if layout == "sorted":
+        codes = np.sort(codes)
+    elif layout == "empty_groups":
+        codes = np.sort(codes % 2) * 3
+    M, W = rng.random((50, 3)), rng.random((4, 3))
+
+    np.testing.assert_allclose(segment_dot(M, W, codes).eval(), np.sum(M * W[codes], axis=1))
+    verify_grad(lambda M, W: SegmentDot()(M, W, codes) ** 2, [M, W], rng=rng)
+
+
+def test_segment_dot_without_custom_ops():
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 4, 50)
+    M, W = rng.random((50, 3)), rng.random((4, 3))
+    f = pytensor.function([], segment_dot(M, W, codes, custom_ops=False))
+    assert not any(isinstance(node.op, SegmentDot) for node in f.maker.fgraph.toposort())
+    np.testing.assert_allclose(f(), np.sum(M * W[codes], axis=1))
+
+
+def test_segment_dot_with_complete_pooling():
+    rng = np.random.default_rng(0)
+    M, W = rng.random((50, 3)), rng.random((1, 3))
+    np.testing.assert_allclose(segment_dot(M, W, np.zeros(50, dtype=int), complete=True).eval(), M @ W[0])
+
+
+@pytest.mark.parametrize("layout", ["shuffled", "sorted", "empty_groups"])
+def test_segment_sum(layout):
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 4, 50)
+    if layout == "sorted":
+        codes = np.sort(codes)
+    elif layout == "empty_groups":
+        codes = np.sort(codes % 2) * 3
+    M, v = rng.random((50, 3)), rng.random(50)
+
+    expected = np.zeros((4, 3))
+    np.add.at(expected, codes, M * v[:, None])
+    np.testing.assert_allclose(SegmentSum()(M, v, codes, 4).eval(), expected)
+    verify_grad(lambda M, v: SegmentSum()(M, v, codes, 4) ** 2, [M, v], rng=rng)
+
+
+def test_segment_dot_follows_new_codes():
+    rng = np.random.default_rng(0)
+    M, W = rng.random((50, 3)), rng.random((4, 3))
+    codes = pytensor.shared(np.sort(rng.integers(0, 4, 50)))
+    f = pytensor.function([], SegmentDot()(M, W, codes))
+    np.testing.assert_allclose(f(), np.sum(M * W[codes.get_value()], axis=1))
+    np.testing.assert_allclose(f(), np.sum(M * W[codes.get_value()], axis=1))
+
+    codes.set_value(rng.integers(0, 4, 50))
+    np.testing.assert_allclose(f(), np.sum(M * W[codes.get_value()], axis=1))
+
+
+@pytest.mark.parametrize("code", [-1, 4])
+def test_segment_dot_raises_on_codes_outside_groups(code):
+    rng = np.random.default_rng(0)
+    M, W = rng.random((50, 3)), rng.random((4, 3))
+    codes = np.sort(rng.integers(0, 4, 50))
+    codes[0 if code < 0 else -1] = code
+    with pytest.raises(ValueError, match="group codes must be in"):
+        SegmentDot()(M, W, codes).eval()
@@ -0,0 +1,30 @@
+import json
+
+import numpy as np
+
+from usopp import FourierSeasonality, LinearTrend
+from usopp.profiling import Profiler
+from usopp.utils import trend_data
+
+
+def test_profiler_records_fit_and_predict_phases():
+    np.random.seed(42)
+    data, _ = trend_data(2)
+    model = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    with Profiler(trace_memory=False) as profiler:
+        model.fit(data[["t"]], data["value"])
+    model.predict(data[["t"]])
+
+    result = profiler.to_dict()
+    assert {"fit", "fit/scale", "fit/definition", "fit/compile", "fit/optimize"} <= set(result["phases"])
+    assert result["phases"][f"fit/definition/{model.left.name}"]["calls"] == 1
+    assert result["counters"]["fit/grad_evals"] == model._map_optimizer_.n_evals_
+    assert not any(path.startswith("predict") for path in result["phases"])
+
+    with Profiler() as profiler:
+        model.predict(data[["t"]], ci_percentiles=[5, 95], max_memory=10_000)
+    phases = json.loads(profiler.to_json())["phases"]
+    component = phases[f"predict/components/{model.right.name}"]
+    assert component["calls"] > 1
+    assert phases["predict"]["peak_memory"] > 0
+    assert phases["predict"]["seconds"] >= component["seconds"]
@@ -2,7 +2,7 @@ import numpy as np
 import pandas as pd
 
 from usopp import RBFSeasonality
-from usopp.utils import IdentityScaler, get_periodic_peaks
+from usopp.utils import IdentityScaler, get_periodic_peaks, trend_data
 
 
 def test_can_fit_generated_data(rbf_seasonal_data):
@@ -14,3 +14,24 @@ def test_can_fit_generated_data(rbf_seasonal_data):
     res = model.predict(data[['t']])
     np.testing.assert_allclose(res.yhat.squeeze(), data['value'], atol=0.01)
     np.testing.assert_allclose(model_beta, true_beta, atol=0.12)
+
+
+def test_truncated_basis_matches_dense():
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.01)
+    data["store"] = pd.Categorical(np.where(np.arange(len(data)) % 2, "a", "b"))
+    X = data[["t", "store"]]
+
+    def fit(**kwargs):
+        model = RBFSeasonality(n_peaks=60, sigma=0.005, pool_cols="store", pool_type="unpooled", **kwargs)
+        model.fit(X, data["value"], y_scaler=IdentityScaler)
+        return model
+
+    dense, truncated = fit(), fit(truncate=6)
+    assert truncated.n_band_ < 60
+    basis = truncated._basis(truncated._scale(X)["t"])
+    assert basis.nnz == len(X) * truncated.n_band_
+    np.testing.assert_allclose(
+        basis.toarray(), dense._basis(dense._scale(X)["t"]), atol=np.exp(-18)
+    )
+    np.testing.assert_allclose(truncated.predict(X).yhat, dense.predict(X).yhat, atol=1e-4)
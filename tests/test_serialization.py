@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from usopp import FourierSeasonality, LinearTrend, Regressor
+from usopp.serialization import load_model, save_model
+
+
+def test_save_and_load_predict_the_same(additive_timeseries_data, tmp_path):
+    data, n_components, n_changepoints, n_features = additive_timeseries_data
+    feature_names = [f"feature{i}" for i in range(n_features)]
+    model = (
+        FourierSeasonality(n=n_components)
+        + LinearTrend(n_changepoints=n_changepoints)
+        + Regressor(on=feature_names)
+    )
+    model.fit(data[["t", *feature_names]], data["value"])
+    save_model(model, tmp_path / "model")
+
+    loaded = load_model(tmp_path / "model")
+    assert all(isinstance(values, np.memmap) for values in loaded.trace_.values())
+    pd.testing.assert_frame_equal(
+        loaded.predict(data[["t", *feature_names]], ci_percentiles=[5, 95]),
+        model.predict(data[["t", *feature_names]], ci_percentiles=[5, 95]),
+    )
+
+
+def test_save_mcmc_trace_as_float32(trend_data, linear_trend_trace, tmp_path):
+    data, _, n_changepoints = trend_data
+    model = LinearTrend(n_changepoints=n_changepoints)
+    model.fit(data[["t"]], data["value"])
+    model.trace_ = linear_trend_trace(model, n_draws=30)
+    save_model(model, tmp_path / "model", dtype="float32")
+
+    with open(tmp_path / "model" / "metadata.json") as f:
+        assert json.load(f)["n_draws"] == 60
+    loaded = load_model(tmp_path / "model")
+    assert loaded.trace_[model._param_name("delta")].shape == (60, 1, n_changepoints)
+    np.testing.assert_allclose(
+        loaded.predict(data[["t"]], ci_percentiles=[50]),
+        model.predict(data[["t"]], ci_percentiles=[50]),
+        rtol=1e-5, atol=1e-5,
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usopp import FourierSeasonality, LinearTrend
+from usopp.profiling import Profiler
+from usopp.utils import IdentityScaler
+
+
+@pytest.fixture
+def fitted(grouped_trend_data):
+    data = grouped_trend_data
+    model = (
+        LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+        + FourierSeasonality(n=2, pool_cols="store", pool_type="unpooled")
+    )
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    return model, data[["t", "store"]]
+
+
+def _chunks(X, size=700):
+    return (X.iloc[start:start + size] for start in range(0, len(X), size))
+
+
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_predict_iter_matches_predict(fitted, n_workers):
+    model, X = fitted
+    expected = model.predict(X, ci_percentiles=[5, 95])
+    with Profiler(trace_memory=False) as profiler:
+        res = list(model.predict_iter(_chunks(X), n_workers=n_workers, ci_percentiles=[5, 95]))
+    assert len(res) == 5
+    pd.testing.assert_frame_equal(pd.concat(res), expected)
+    assert profiler.phases["predict"]["calls"] == 5
+
+
+def test_predict_iter_spawns_noise_per_chunk(fitted):
+    model, X = fitted
+    kwargs = dict(ci_percentiles=[5, 95], include_noise=True, random_seed=0)
+    first = pd.concat(model.predict_iter(_chunks(X), **kwargs))
+    again = pd.concat(model.predict_iter(_chunks(X), n_workers=2, **kwargs))
+    pd.testing.assert_frame_equal(first, again)
+    np.testing.assert_raises(
+        AssertionError, np.testing.assert_allclose, first.percentile_5.values[:700], first.percentile_5.values[700:1400]
+    )
+
+
+def test_predict_iter_reads_and_writes_parquet(fitted, tmp_path):
+    pytest.importorskip("pyarrow")
+    from usopp.streaming import write_parquet
+
+    model, X = fitted
+    X.to_parquet(tmp_path / "X.parquet")
+    n_rows = write_parquet(model.predict_iter(tmp_path / "X.parquet", batch_size=1000), tmp_path / "yhat.parquet")
+    assert n_rows == len(X)
+    res = pd.read_parquet(tmp_path / "yhat.parquet")
+    np.testing.assert_allclose(res.yhat, model.predict(X).yhat)
@@ -0,0 +1,311 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usopp import FourierSeasonality, LinearTrend
+from usopp.utils import IdentityScaler, trend_data
+
+
+def test_predict_uses_group_of_each_row(grouped_trend_data):
+    data = grouped_trend_data
+    model = (
+        LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+        + FourierSeasonality(n=2, pool_cols="store", pool_type="unpooled")
+    )
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    res = model.predict(data[["t", "store"]])
+
+    scaled_t = model._X_scaler_.transform(data[["t"]])["t"].values
+    for code, name in model.left.groups_.items():
+        mask = (data["store"] == name).values
+        expected = model._predict(model.trace_, scaled_t[mask], code).mean(axis=1)
+        np.testing.assert_allclose(res.yhat[mask], expected)
+
+
+def test_fit_with_unused_category(grouped_trend_data):
+    data = grouped_trend_data[grouped_trend_data["store"] != "b"].sort_values("store", kind="stable")
+    data = data.reset_index(drop=True)
+    assert list(data["store"].cat.categories) == ["a", "b", "c"]
+    model = FourierSeasonality(n=2, pool_cols="store", pool_type="unpooled")
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    assert model.trace_[model._param_name("beta")].shape[0] == 3
+
+    res = model.predict(data[["t", "store"]])
+    assert res.yhat.notna().all()
+
+
+def test_predict_raises_on_unseen_group(grouped_trend_data):
+    data = grouped_trend_data
+    model = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    X = data[["t", "store"]].copy()
+    X["store"] = X["store"].cat.add_categories("d")
+    X.loc[0, "store"] = "d"
+    with pytest.raises(ValueError, match="not seen during fit"):
+        model.predict(X)
+
+
+@pytest.mark.parametrize("ci_percentiles", [None, [5, 50, 95]])
+def test_predict_within_memory_budget_matches_full_predict(grouped_trend_data, linear_trend_trace, ci_percentiles):
+    data = grouped_trend_data
+    model = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    model.trace_ = linear_trend_trace(model)
+
+    expected = model.predict(data[["t", "store"]], ci_percentiles=ci_percentiles)
+    cached = list(model._basis_cache._entries)
+    res = model.predict(data[["t", "store"]], ci_percentiles=ci_percentiles, max_memory=3_000)
+    pd.testing.assert_frame_equal(res, expected)
+    assert set(cached) <= set(model._basis_cache._entries)
+    if ci_percentiles is not None:
+        # every row block is evaluated once and not cached
+        assert list(model._basis_cache._entries) == cached
+
+
+def test_refit_reuses_compiled_model_and_matches_fit(grouped_trend_data):
+    data = grouped_trend_data
+    first, second = data.iloc[:1500], data.iloc[1500:].reset_index(drop=True)
+    second = second.assign(t=first["t"].values, value=second["value"] * 2)
+    model = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+    model.fit(first[["t", "store"]], first["value"], y_scaler=IdentityScaler)
+    optimizer = model._map_optimizer_
+
+    model.refit(second[["t", "store"]], second["value"])
+    assert model._map_optimizer_ is optimizer
+
+    expected = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+    expected.fit(second[["t", "store"]], second["value"], y_scaler=IdentityScaler)
+    np.testing.assert_allclose(
+        model.predict(second[["t", "store"]]).yhat, expected.predict(second[["t", "store"]]).yhat, atol=1e-3
+    )
+
+
+def test_predict_with_noise_covers_observations():
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.1)
+    model = LinearTrend(n_changepoints=2)
+    model.fit(data[["t"]], data["value"], y_scaler=IdentityScaler)
+
+    without_noise = model.predict(data[["t"]], ci_percentiles=[5, 95])
+    res = model.predict(data[["t"]], ci_percentiles=[5, 95], include_noise=True, random_seed=0)
+    pd.testing.assert_series_equal(res.yhat, without_noise.yhat)
+    coverage = ((data["value"] >= res.percentile_5) & (data["value"] <= res.percentile_95)).mean()
+    assert 0.85 < coverage < 0.95
+
+    again = model.predict(data[["t"]], ci_percentiles=[5, 95], include_noise=True, random_seed=0, max_memory=100_000)
+    pd.testing.assert_frame_equal(again, res)
+
+    with pytest.raises(ValueError, match="include_noise needs ci_percentiles"):
+        model.predict(data[["t"]], include_noise=True)
+
+
+def test_fit_with_advi_predicts_like_map():
+    import pymc as pm
+
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.01)
+    model = LinearTrend(n_changepoints=2)
+    model.fit(
+        data[["t"]], data["value"], method="advi", n=10_000, draws=200, random_seed=0,
+        obj_optimizer=pm.adam(learning_rate=0.01), progressbar=False,
+    )
+    assert model.trace_.sizes["draw"] == 200
+
+    expected = LinearTrend(n_changepoints=2)
+    expected.fit(data[["t"]], data["value"])
+    res = model.predict(data[["t"]], ci_percentiles=[5, 95])
+    np.testing.assert_allclose(res.yhat, expected.predict(data[["t"]]).yhat, atol=0.01)
+    assert (res.percentile_95 > res.percentile_5).all()
+
+
+def test_fit_with_scipy_optimizer_method(monkeypatch):
+    import usopp.optimize
+
+    methods = []
+    minimize = usopp.optimize.minimize
+
+    def spy(*args, method, **kwargs):
+        methods.append(method)
+        return minimize(*args, method=method, **kwargs)
+
+    monkeypatch.setattr(usopp.optimize, "minimize", spy)
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.0001)
+    model = LinearTrend(n_changepoints=2)
+    model.fit(data[["t"]], data["value"], y_scaler=IdentityScaler, optimizer_method="BFGS")
+    assert methods == ["BFGS"]
+    np.testing.assert_allclose(model.predict(data[["t"]]).yhat, data["value"], atol=0.01)
+
+    model.refit(data[["t"]], data["value"])
+    assert methods == ["BFGS", "L-BFGS-B"]
+    with pytest.raises(ValueError, match="optimizer_method needs method 'map'"):
+        model.refit(data[["t"]], data["value"], method="advi", optimizer_method="BFGS")
+
+
+def test_fit_accepts_find_map_arguments():
+    data, _ = trend_data(2)
+    model = LinearTrend(n_changepoints=2)
+    model.fit(data[["t"]], data["value"], seed=1, include_transformed=False, progressbar=False)
+    assert model._param_name("k") in model.trace_
+    assert not [name for name in model.trace_ if name.endswith("_log__")]
+    assert model.predict(data[["t"]]).yhat.notna().all()
+
+    with pytest.raises(TypeError, match="find_MAP arguments return_raw"):
+        model.refit(data[["t"]], data["value"], return_raw=True)
+
+
+def test_fit_raises_on_unknown_method():
+    data, _ = trend_data(2)
+    with pytest.raises(ValueError, match="method must be one of .* optimizer_method"):
+        LinearTrend(n_changepoints=2).fit(data[["t"]], data["value"], method="BFGS")
+
+
+def test_fit_with_advi_on_minibatches():
+    import pymc as pm
+
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.01)
+    model = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    model.fit(
+        data[["t"]], data["value"], method="advi", batch_size=100, n=5_000, draws=200, random_seed=0,
+        obj_optimizer=pm.adam(learning_rate=0.01), progressbar=False,
+    )
+
+    expected = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    expected.fit(data[["t"]], data["value"])
+    np.testing.assert_allclose(model.predict(data[["t"]]).yhat, expected.predict(data[["t"]]).yhat, atol=0.02)
+
+    # the kept model sees all rows, so refit and update get a deterministic objective
+    logp = model._model_.compile_logp()
+    point = model._model_.initial_point()
+    assert logp(point) == logp(point)
+    # and the method of fit is their default
+    model.update(data[["t"]].iloc[-10:], data["value"].iloc[-10:], n=100, draws=20, progressbar=False)
+    assert model._model_["y_scaled"].get_value().shape == (len(data) + 10,)
+    assert model.trace_.sizes["draw"] == 20
+    model.refit(data[["t"]], data["value"], use_mcmc=False)
+    assert isinstance(model.trace_, dict)
+
+
+def test_fit_raises_on_minibatch_without_advi():
+    data, _ = trend_data(2)
+    with pytest.raises(ValueError, match="batch_size needs method"):
+        LinearTrend(n_changepoints=2).fit(data[["t"]], data["value"], batch_size=100)
+
+
+def test_update_warm_starts_from_previous_fit():
+    np.random.seed(42)
+    data, _ = trend_data(2, noise=0.01)
+    first, new = data.iloc[:900], data.iloc[900:]
+    model = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    model.fit(first[["t"]], first["value"])
+    model.update(new[["t"]], new["value"])
+    warm_evals = model._map_optimizer_.n_evals_
+
+    expected = LinearTrend(n_changepoints=2) + FourierSeasonality(n=2)
+    expected.fit(first[["t"]], first["value"])
+    expected.refit(data[["t"]], data["value"])
+    assert warm_evals < expected._map_optimizer_.n_evals_
+    np.testing.assert_allclose(model.predict(data[["t"]]).yhat, expected.predict(data[["t"]]).yhat, atol=1e-3)
+
+
+def test_fit_falls_back_to_pymc_sampler_when_backend_is_missing(monkeypatch):
+    import importlib.util
+
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None if name == "nutpie" else find_spec(name))
+    data, _ = trend_data(2)
+    model = LinearTrend(n_changepoints=2)
+    with pytest.warns(UserWarning, match="falling back to 'pymc'"):
+        model.fit(
+            data[["t"]], data["value"], method="mcmc", backend="nutpie",
+            draws=20, tune=20, chains=1, cores=1, progressbar=False,
+        )
+    assert model._backend_ == "pymc"
+    assert model.predict(data[["t"]]).yhat.notna().all()
+
+
+def test_model_for_other_backends_compiles_with_numba(grouped_trend_data):
+    import warnings
+
+    from usopp import RBFSeasonality
+    from usopp.context import FitContext
+    from usopp.utils import get_periodic_peaks
+
+    pytest.importorskip("numba")
+    data = grouped_trend_data
+    model = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled") + RBFSeasonality(
+        peaks=get_periodic_peaks(4), sigma=0.05, truncate=3, pool_cols="store", pool_type="unpooled",
+    )
+    model.fit(data[["t", "store"]], data["value"])
+    X_scaled = model._scale(data[["t", "store"]])
+    with FitContext(X_scaled, custom_ops=False):
+        plain = model._build_model(X_scaled, model._y_scaler_.transform(data["value"]), model._likelihood_)
+
+    point = model._model_.initial_point()
+    with warnings.catch_warnings():
+        # ops without a numba implementation warn that they run in object mode
+        warnings.simplefilter("error")
+        logp = plain.compile_logp(mode="NUMBA")
+    np.testing.assert_allclose(logp(point), model._model_.compile_logp()(point), rtol=1e-6)
+
+
+def test_fit_raises_on_backend_without_mcmc():
+    data, _ = trend_data(2)
+    with pytest.raises(ValueError, match="needs method 'mcmc'"):
+        LinearTrend(n_changepoints=2).fit(data[["t"]], data["value"], backend="numpyro")
+
+
+def test_fit_computes_group_layout_once_per_pool_column(grouped_trend_data, monkeypatch):
+    import usopp.context
+
+    calls = []
+    group_layout = usopp.context.group_layout
+    monkeypatch.setattr(usopp.context, "group_layout", lambda *args: calls.append(args[1:]) or group_layout(*args))
+    data = grouped_trend_data
+    model = (
+        LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+        + FourierSeasonality(n=2, pool_cols="store", pool_type="partial")
+        + FourierSeasonality(n=2, period=pd.Timedelta(days=7))
+    )
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+    assert calls == [("store", "unpooled"), (None, "complete")]
+
+
+def test_plan_matches_recursive_evaluation():
+    from usopp import Constant
+    from usopp.timeseries_model import _plan_width, _run_plan
+
+    np.random.seed(42)
+    data, _ = trend_data(2)
+    trend, yearly = LinearTrend(n_changepoints=2), FourierSeasonality(n=2)
+    weekly, constant = FourierSeasonality(n=2, period=pd.Timedelta(days=7)), Constant()
+    model = trend + yearly * (weekly + constant)
+    model.fit(data[["t"]], data["value"])
+    X = model._scale(data[["t"]])
+
+    def predict(component):
+        return component._predict(model.trace_, X)
+
+    expected = predict(trend) + predict(yearly) * (1 + predict(weekly) + predict(constant))
+    plan = list(model._plan())
+    assert _plan_width(plan) == 2
+    np.testing.assert_allclose(_run_plan(plan, model.trace_, X), expected)
+    res = _run_plan(plan, model.trace_, X, dtype="float32")
+    assert res.dtype == np.float32
+    np.testing.assert_allclose(res, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_scale_returns_typed_columns(grouped_trend_data):
+    data = grouped_trend_data.assign(feature=np.arange(len(grouped_trend_data), dtype=float))
+    model = LinearTrend(n_changepoints=2, pool_cols="store", pool_type="unpooled")
+    model.fit(data[["t", "store"]], data["value"], y_scaler=IdentityScaler)
+
+    X = data[["t", "store", "feature"]]
+    columns = model._scale(X)
+    assert len(columns) == len(X)
+    expected = model._X_scaler_.transform(X[["t"]])["t"].values
+    np.testing.assert_allclose(columns["t"], expected)
+    assert isinstance(columns["store"], pd.Categorical)
+    assert np.shares_memory(columns["feature"], X["feature"].values)
+    np.testing.assert_array_equal(columns.rows(slice(10, 20))["feature"], X["feature"].values[10:20])
@@ -4,7 +4,7 @@ from hypothesis import given
 from hypothesis import strategies as st
 from hypothesis.extra.numpy import arrays, array_shapes
 from hypothesis.extra.pandas import data_frames, column, series, range_indexes
-from usopp.utils import MinMaxScaler
+from usopp.utils import BasisCache, MinMaxScaler, uncached_bases
 
 
 @given(
@@ -69,3 +69,42 @@ def test_minmax_scaler_df(df):
     assert (scaler.transform(df).max(axis=0) <= 1).all()
     np.testing.assert_allclose(scaler.fit(df).transform(df), scaler.fit_transform(df), rtol=1e-06, atol=1e-06)
     np.testing.assert_allclose(df, scaler.inv_transform(scaler.transform(df)), rtol=1e-06, atol=1e-06)
+
+
+def test_basis_cache_reuses_and_evicts():
+    # room for two 5 x 3 matrices with their time vectors
+    cache = BasisCache(max_bytes=2 * (15 + 5) * 8)
+    calls = []
+
+    def build(t):
+        calls.append(t)
+        return t[:, None] * np.ones(3)
+
+    t1, t2, t3 = np.linspace(0, 1, 5), np.linspace(0, 2, 5), np.linspace(0, 3, 5)
+    basis = cache.get(t1, build)
+    assert cache.get(t1.copy(), build) is basis
+    cache.get(t2, build)
+    cache.get(t3, build)
+    assert len(calls) == 3
+    cache.get(t1, build)
+    assert len(calls) == 4
+
+
+def test_basis_cache_skips_large_and_uncached_matrices():
+    cache = BasisCache(max_bytes=100)
+    calls = []
+
+    def build(t):
+        calls.append(t)
+        return t[:, None] * np.ones(3)
+
+    t = np.linspace(0, 1, 5)
+    cache.get(t, build)
+    cache.get(t, build)
+    assert len(calls) == 2
+
+    cache = BasisCache()
+    with uncached_bases():
+        cache.get(t, build)
+    cache.get(t, build)
+    assert len(calls) == 4
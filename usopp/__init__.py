@@ -6,6 +6,8 @@ from usopp.logistic_growth import LogisticGrowth
 from usopp.indicator import Indicator
 from usopp.constant import Constant
 from usopp.regressor import Regressor
+from usopp.batch import fit_many, fit_stacked
 
 __all__ = ["LinearTrend", "TimeSeriesModel", "FourierSeasonality", "Indicator",
-           "Constant", "Regressor", "LogisticGrowth", "RBFSeasonality"]
+           "Constant", "Regressor", "LogisticGrowth", "RBFSeasonality", "fit_many",
+           "fit_stacked"]
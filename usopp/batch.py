@@ -0,0 +1,98 @@
+import copy
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from usopp.likelihood import Gaussian
+
+
+def _fit_series(template, X, y, fit_kwargs):
+    model = copy.deepcopy(template)
+    try:
+        model.fit(X, y, **fit_kwargs)
+    except Exception:
+        return None, traceback.format_exc()
+    return model, None
+
+
+def fit_many(template, X, y, series_col, n_workers=None, **fit_kwargs):
+    """
+    Fits a copy of ``template`` to every series in a long DataFrame.
+
+    ``X`` holds the rows of all series, ``series_col`` identifies the series of each row
+    and is dropped before fitting. Rows are selected by position, so the index may repeat
+    labels across series. The fits are fanned out over ``n_workers`` processes,
+    ``n_workers=1`` fits in the calling process. ``fit_kwargs`` are passed to ``fit``.
+
+    Every series builds and compiles its own PyMC model, its changepoints and scalers
+    depend on its data. Only the compiled C modules are reused, through pytensor's
+    on-disk cache.
+
+    Returns a tuple ``(models, errors)`` of dicts keyed by series id: the fitted models,
+    and the formatted traceback of every series whose fit raised.
+    """
+    series = X[series_col]
+    X = X.drop(columns=[series_col])
+    tasks = {
+        series_id: (template, X.iloc[rows], y.iloc[rows], fit_kwargs)
+        for series_id, rows in series.groupby(series, sort=False, observed=True).indices.items()
+    }
+
+    if n_workers == 1:
+        results = {series_id: _fit_series(*task) for series_id, task in tasks.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {series_id: executor.submit(_fit_series, *task) for series_id, task in tasks.items()}
+            results = {series_id: future.result() for series_id, future in futures.items()}
+
+    models, errors = {}, {}
+    for series_id, (model, error) in results.items():
+        if error is None:
+            models[series_id] = model
+        else:
+            errors[series_id] = error
+    return models, errors
+
+
+def fit_stacked(template, X, y, series_col, pool_type="unpooled", **fit_kwargs):
+    """
+    Fits all series in a long DataFrame with a single model, so the graph is built and
+    compiled once and one optimization or NUTS run covers every series.
+
+    Every component of a copy of ``template`` is pooled on ``series_col`` with
+    ``pool_type``, i.e. gets its own parameters per series (``"unpooled"``) or per series
+    drawn from a shared prior (``"partial"``). The components of ``template`` must be
+    completely pooled. The noise parameters of the likelihood (default ``Gaussian``) are
+    estimated per series as well. ``fit_kwargs`` are passed to ``fit``.
+
+    This is not equivalent to ``fit_many``: the scalers are shared by all series, so ``y``
+    is divided by the maximum over all series and the priors of a series with small values
+    are relatively wider than in its own fit.
+
+    Returns the fitted model. Its ``predict`` takes rows of any of the series, with
+    ``series_col`` identifying the series of each row.
+    """
+    if pool_type not in ("unpooled", "partial"):
+        raise ValueError(f"pool_type must be 'unpooled' or 'partial', got {pool_type!r}")
+    model = copy.deepcopy(template)
+    for component in model._components():
+        if component.pool_type != "complete":
+            raise ValueError(
+                f"{component} is already pooled on {component.pool_cols!r}, "
+                "fit_stacked needs completely pooled components"
+            )
+        component.pool_cols = series_col
+        component.pool_type = pool_type
+
+    likelihood = copy.deepcopy(fit_kwargs.pop("likelihood", None)) or Gaussian()
+    if likelihood.pool_cols is not None:
+        raise ValueError(f"{type(likelihood).__name__} is already pooled on {likelihood.pool_cols!r}")
+    likelihood.pool_cols = series_col
+
+    if model._fit_method(fit_kwargs.get("use_mcmc", False), fit_kwargs.get("method")) == "map":
+        # the series converge at different rates, a longer L-BFGS memory and no stop on the
+        # relative change of the summed objective keep the slow ones from being cut short
+        fit_kwargs.setdefault("options", {"maxcor": 50, "ftol": 1e-15})
+
+    X = X.assign(**{series_col: X[series_col].astype("category")})
+    model.fit(X, y, likelihood=likelihood, **fit_kwargs)
+    return model
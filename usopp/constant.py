@@ -1,12 +1,12 @@
 import numpy as np
-import pymc as pm
-from xarray.core.dataset import Dataset
 
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
+from usopp.utils import add_subplot, get_posterior, take_group
 
 
 class Constant(TimeSeriesModel):
+    _predict_params = ("c",)
+
     def __init__(self, name: str = None, lower=0, upper=1, pool_cols=None, pool_type='complete'):
         self.pool_cols = pool_cols
         self.pool_type = pool_type
@@ -17,7 +17,10 @@ class Constant(TimeSeriesModel):
         super().__init__()
 
     def definition(self, model, X, scale_factor):
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
+        import pymc as pm
+
+        n_groups = self._group_definition(X)
+        group = self._register_data(model, self._design(X))["group"]
 
         with model:
             if self.pool_type == "partial":
@@ -30,13 +33,13 @@ class Constant(TimeSeriesModel):
 
         return c[group]
 
-    def _predict(self, trace, t, pool_group=0):
-        if isinstance(trace, Dataset):
-            ind = trace[self._param_name("c")][:, :, pool_group].values
-        else:
-            ind = trace[self._param_name("c")][pool_group]
+    def _design(self, X):
+        return {"group": self._group_codes(X)}
 
-        return np.ones_like(t) * ind.reshape(1, -1)
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        c = take_group(get_posterior(trace, self._param_name("c")), pool_group)
+        return np.ones((len(t), 1)) * c
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = drawer.add_subplot()
@@ -0,0 +1,57 @@
+"""
+Shared state of a single ``fit``.
+
+Components pooled on the same column need the same group codes. ``fit`` enters a
+``FitContext`` for the scaled data, and the components look up the group layout of
+their pool column in it, so it is computed once per column instead of once per
+component.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from usopp.utils import get_group_definition
+
+
+class GroupLayout(NamedTuple):
+    """Group codes of the rows of ``X``."""
+    codes: np.ndarray
+    n_groups: int
+    groups: dict
+
+
+def group_layout(X, pool_cols, pool_type):
+    codes, n_groups, groups = get_group_definition(X, pool_cols, pool_type)
+    return GroupLayout(np.asarray(codes), n_groups, groups)
+
+
+class FitContext:
+    """
+    Context of a ``fit`` on the scaled data ``X``. Use ``FitContext.get_context()`` to get
+    the innermost active context. Without ``custom_ops``, the graphs only use ops the JAX
+    and numba backends of pytensor can compile.
+    """
+    _contexts = []
+
+    def __init__(self, X, custom_ops=True):
+        self.X = X
+        self.custom_ops = custom_ops
+        self._layouts = {}
+
+    def __enter__(self):
+        self._contexts.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._contexts.pop()
+
+    @classmethod
+    def get_context(cls):
+        return cls._contexts[-1] if cls._contexts else None
+
+    def layout(self, pool_cols, pool_type):
+        """Returns the ``GroupLayout`` of ``pool_cols``, computed on first use."""
+        key = None if pool_type == "complete" else pool_cols
+        if key not in self._layouts:
+            self._layouts[key] = group_layout(self.X, pool_cols, pool_type)
+        return self._layouts[key]
@@ -1,12 +1,18 @@
 import numpy as np
 import pandas as pd
-import pymc as pm
-from xarray.core.dataarray import DataArray
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
+from usopp.utils import add_subplot, get_posterior, group_dot
 
 
 class FourierSeasonality(TimeSeriesModel):
+    """
+    Seasonality with ``n`` Fourier harmonics of ``period``. With ``unique_phases``, the
+    basis is computed once per distinct phase within the period and gathered for the
+    rows, which saves most of the work when many rows share a phase, e.g. daily data
+    spanning several periods.
+    """
+    _predict_params = ("beta",)
+
     def __init__(
         self,
         name: str = None,
@@ -14,9 +20,11 @@ class FourierSeasonality(TimeSeriesModel):
         period: pd.Timedelta = pd.Timedelta(days=365.25),
         shrinkage_strength=100,
         pool_cols=None,
-        pool_type='complete'
+        pool_type='complete',
+        unique_phases=False,
     ):
         self.n = n
+        self.unique_phases = unique_phases
         self.period = period
         self.shrinkage_strength = shrinkage_strength
         self.pool_cols = pool_cols
@@ -25,15 +33,45 @@ class FourierSeasonality(TimeSeriesModel):
         super().__init__()
 
     @staticmethod
-    def _X_t(t, p=365.25, n=10):
-        x = 2 * np.pi * (np.arange(n) + 1) * t[:, None] / p
-        return np.concatenate((np.cos(x), np.sin(x)), axis=1)
+    def _harmonics(x, n):
+        """
+        Returns ``cos(k * x)`` and ``sin(k * x)`` for ``k = 1..n`` side by side. Only the
+        first harmonic calls cos and sin, the others follow from the angle-addition formulas.
+        """
+        # harmonics on the leading axis keep every row of the recurrence contiguous
+        out = np.empty((2 * n, len(x)))
+        cos, sin = out[:n], out[n:]
+        np.cos(x, out=cos[0])
+        np.sin(x, out=sin[0])
+        for k in range(1, n):
+            np.multiply(cos[k - 1], cos[0], out=cos[k])
+            cos[k] -= sin[k - 1] * sin[0]
+            np.multiply(sin[k - 1], cos[0], out=sin[k])
+            sin[k] += cos[k - 1] * sin[0]
+        return out.T
+
+    @staticmethod
+    def _X_t(t, p=365.25, n=10, unique_phases=False):
+        if not unique_phases:
+            return FourierSeasonality._harmonics(2 * np.pi * t / p, n)
+        # rounding merges phases that only differ by the rounding error of t / p
+        phases, inverse = np.unique(np.round((t / p) % 1, 12), return_inverse=True)
+        return FourierSeasonality._harmonics(2 * np.pi * phases, n)[inverse.ravel()]
+
+    def _basis(self, t):
+        return self._basis_cache.get(t, lambda t: self._X_t(t, self.p_, self.n, self.unique_phases))
+
+    def _design(self, X):
+        return {"X_t": self._basis(X["t"]), "group": self._group_codes(X)}
 
     def definition(self, model, X, scale_factor):
-        self.t_idx_ = X.columns.get_loc("t")
-        t = X["t"].values
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
+        import pymc as pm
+
+        n_groups = self._group_definition(X)
         self.p_ = self.period / scale_factor['t']
+        self._basis_cache.clear()
+        data = self._register_data(model, self._design(X))
+        X_t, group = data["X_t"], data["group"]
         n_params = self.n * 2
 
         with model:
@@ -52,25 +90,15 @@ class FourierSeasonality(TimeSeriesModel):
             else:
                 beta = pm.Normal(self._param_name("beta"), 0, 1, shape=(n_groups, n_params))
 
-            seasonality = pm.math.sum(self._X_t(t, self.p_, self.n) * beta[group], axis=1)
+            seasonality = self._segment_dot(X_t, beta, group)
 
         return seasonality
 
-    def _predict(self, trace, t, pool_group=0):
-        if len(t.shape) != 1:
-            t = t[:, self.t_idx_].squeeze()
-
-        beta = trace[self._param_name("beta")]
-        # mcmc
-        if isinstance(beta, DataArray):
-            beta = beta.values[:, :,pool_group, :].reshape(-1, self.n *2).T
-            result = self._X_t(t, self.p_, self.n) @ beta
-        # MAP
-        else:
-            beta = beta[pool_group, :]
-            result = self._X_t(t, self.p_, self.n) @ beta
-            result = result.reshape(result.shape[0], -1)
-        return result
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        t = self._get_t(t)
+        beta = get_posterior(trace, self._param_name("beta"))
+        return group_dot(self._basis(t), beta, pool_group)
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = drawer.add_subplot()
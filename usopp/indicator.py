@@ -1,11 +1,11 @@
 import numpy as np
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
-import pymc as pm
-from scipy.stats import mode
+from usopp.utils import add_subplot, get_posterior, take_group
 
 
 class Indicator(TimeSeriesModel):
+    _predict_params = ("ind",)
+
     def __init__(self, name: str = None, pool_cols=None, pool_type='complete'):
         self.pool_cols = pool_cols
         self.pool_type = pool_type
@@ -13,7 +13,10 @@ class Indicator(TimeSeriesModel):
         super().__init__()
 
     def definition(self, model, X, scale_factor):
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
+        import pymc as pm
+
+        n_groups = self._group_definition(X)
+        group = self._register_data(model, self._design(X))["group"]
 
         with model:
             if self.pool_type == "partial":
@@ -24,12 +27,17 @@ class Indicator(TimeSeriesModel):
 
         return ind[group]
 
-    def _predict(self, trace, t, pool_group=0):
-        ind = trace[self._param_name("ind")][:, pool_group]
+    def _design(self, X):
+        return {"group": self._group_codes(X)}
 
-        return np.ones_like(t)[:, None] * ind.reshape(1, -1)
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        ind = take_group(get_posterior(trace, self._param_name("ind")), pool_group)
+        return np.ones((len(t), 1)) * ind
 
     def plot(self, trace, scaled_t, y_scaler):
+        from scipy.stats import mode
+
         ax = add_subplot()
         ax.set_title(str(self))
         ax.set_xticks([])
@@ -1,32 +1,98 @@
 from abc import ABC, abstractmethod
-import pymc as pm
+
+import numpy as np
+
+from usopp.utils import get_group_codes, get_posterior
 
 
 class Likelihood(ABC):
-    """Subclasses should implement the observed method which defines an observed random variable"""
+    """
+    Subclasses should implement the observed method which defines an observed random variable.
+    ``total_size`` is the number of rows when ``y_scaled`` is a minibatch.
+
+    With ``pool_cols``, the noise parameters are estimated per group of that column, and
+    ``observed`` gets the group code of each row as ``group``.
+    """
+    # names of the trace variables sample reads
+    _predict_params = ()
+    pool_cols = None
+
     @abstractmethod
-    def observed(self, mu, y_scaled):
+    def observed(self, mu, y_scaled, total_size=None, group=None):
         pass
 
+    def sample(self, mu, trace, rng, n_noise=1, group=None):
+        """
+        Draws observations around ``mu`` of shape ``(n_rows, n_draws)``, ``n_noise`` per
+        posterior draw of the noise parameters in ``trace``, using the parameters of the
+        ``group`` of each row if the likelihood is pooled. Returns an array of shape
+        ``(n_rows, n_draws * n_noise)``.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support sampling observations")
+
+    def _group_codes(self, X):
+        """Returns the group code of each row of the ``Columns`` ``X``, None if not pooled."""
+        if self.pool_cols is None:
+            return None
+        return get_group_codes(X[self.pool_cols], self.groups_)
+
+    def _shape(self):
+        return () if self.pool_cols is None else len(self.groups_)
+
+    @staticmethod
+    def _per_row(param, group):
+        return param if group is None else param[group]
+
+    @staticmethod
+    def _noise_param(trace, name, n_noise, group=None):
+        values = get_posterior(trace, name)
+        if group is None:
+            return np.repeat(values, n_noise)
+        return np.repeat(values[:, group].T, n_noise, axis=1)
+
 
 class Gaussian(Likelihood):
     """Gaussian likelihood with constant variance"""
-    def __init__(self, sigma=0.5):
+    _predict_params = ("sigma",)
+
+    def __init__(self, sigma=0.5, pool_cols=None):
         self.sigma = sigma
+        self.pool_cols = pool_cols
+
+    def observed(self, mu, y_scaled, total_size=None, group=None):
+        import pymc as pm
+
+        sigma = pm.HalfCauchy("sigma", self.sigma, shape=self._shape())
+        pm.Normal("obs", mu=mu, sigma=self._per_row(sigma, group), observed=y_scaled, total_size=total_size)
 
-    def observed(self, mu, y_scaled):
-        sigma = pm.HalfCauchy("sigma", self.sigma)
-        pm.Normal("obs", mu=mu, sigma=sigma, observed=y_scaled)
+    def sample(self, mu, trace, rng, n_noise=1, group=None):
+        mu = np.repeat(mu, n_noise, axis=1)
+        sigma = self._noise_param(trace, "sigma", n_noise, group)
+        return mu + sigma * rng.standard_normal(mu.shape)
 
 
 class StudentT(Likelihood):
     """StudentT likelihood with constant variance, robust to outliers"""
-    def __init__(self, alpha=1., beta=1., sigma=0.5):
+    _predict_params = ("nu", "sigma")
+
+    def __init__(self, alpha=1., beta=1., sigma=0.5, pool_cols=None):
         self.alpha = alpha
         self.beta = beta
         self.sigma = sigma
+        self.pool_cols = pool_cols
+
+    def observed(self, mu, y_scaled, total_size=None, group=None):
+        import pymc as pm
+
+        nu = pm.InverseGamma("nu", alpha=self.alpha, beta=self.beta, shape=self._shape())
+        sigma = pm.HalfCauchy("sigma", self.sigma, shape=self._shape())
+        pm.StudentT(
+            "obs", mu=mu, sigma=self._per_row(sigma, group), nu=self._per_row(nu, group),
+            observed=y_scaled, total_size=total_size,
+        )
 
-    def observed(self, mu, y_scaled):
-        nu = pm.InverseGamma("nu", alpha=self.alpha, beta=self.beta)
-        sigma = pm.HalfCauchy("sigma", self.sigma)
-        pm.StudentT("obs", mu=mu, sigma=sigma, nu=nu, observed=y_scaled)
+    def sample(self, mu, trace, rng, n_noise=1, group=None):
+        mu = np.repeat(mu, n_noise, axis=1)
+        nu = self._noise_param(trace, "nu", n_noise, group)
+        sigma = self._noise_param(trace, "sigma", n_noise, group)
+        return mu + sigma * rng.standard_t(nu, size=mu.shape)
@@ -1,16 +1,27 @@
 import numpy as np
-from xarray.core.dataset import Dataset
 
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
-import pymc as pm
+from usopp.utils import add_subplot, get_posterior, group_dot, take_group
 
 
 class LinearTrend(TimeSeriesModel):
+    """
+    Piecewise linear trend with ``n_changepoints`` evenly spaced changepoints.
+
+    With ``engine='dense'`` the trend is computed from an ``(n_obs, n_changepoints)``
+    changepoint indicator matrix. ``engine='cumsum'`` instead looks up the number of
+    changepoints before each observation with ``searchsorted`` and gathers from the
+    cumulative sums of the rate changes, which costs O(n_obs + n_changepoints).
+    """
+    _predict_params = ("k", "m", "delta")
+
     def __init__(
             self, name: str = None, n_changepoints=None, changepoints_prior_scale=0.05, growth_prior_scale=1,
-            pool_cols=None, pool_type='complete'
+            pool_cols=None, pool_type='complete', engine='dense'
     ):
+        if engine not in ('dense', 'cumsum'):
+            raise ValueError('invalid `engine`, should be "dense" or "cumsum"')
+        self.engine = engine
         self.n_changepoints = n_changepoints
         self.changepoints_prior_scale = changepoints_prior_scale
         self.growth_prior_scale = growth_prior_scale
@@ -20,14 +31,16 @@ class LinearTrend(TimeSeriesModel):
         super().__init__()
 
     def definition(self, model, X, scale_factor):
-        self.t_idx_ = X.columns.get_loc("t")
-        t = X["t"].values
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
-        self.s = np.linspace(0, np.max(t), self.n_changepoints + 2)[1:-1]
+        import pymc as pm
+        import pytensor.tensor as pt
 
-        with model:
-            A = (t[:, None] > self.s) * 1.0
+        n_groups = self._group_definition(X)
+        self.s = np.linspace(0, np.max(X["t"]), self.n_changepoints + 2)[1:-1]
+        self._basis_cache.clear()
+        data = self._register_data(model, self._design(X))
+        t, group = data["t"], data["group"]
 
+        with model:
             if self.pool_type == 'partial':
                 sigma_k = pm.HalfCauchy(self._param_name('sigma_k'), beta=self.growth_prior_scale)
                 offset_k = pm.Normal(self._param_name('offset_k'), mu=0, sigma=1, shape=n_groups)
@@ -45,31 +58,60 @@ class LinearTrend(TimeSeriesModel):
 
             m = pm.Normal(self._param_name("m"), 0, 5, shape=n_groups)
 
-            gamma = -self.s * delta[group, :]
+            if self.engine == 'cumsum':
+                idx = data["idx"]
+                growth = self._cumulative(delta, pt)[group, idx]
+                offset = self._cumulative(-self.s * delta, pt)[group, idx]
+            else:
+                A = data["A"]
+                growth = self._segment_dot(A, delta, group)
+                offset = self._segment_dot(A, -self.s * delta, group)
 
-            g = (
-                (k[group] + pm.math.sum(A * delta[group], axis=1)) * t
-                + (m[group] + pm.math.sum(A * gamma, axis=1))
-            )
+            g = (k[group] + growth) * t + (m[group] + offset)
         return g
 
-    def _predict(self, trace, t, pool_group=0):
-        if len(t.shape) != 1:
-            t = t[:, self.t_idx_].squeeze()
-        A = (t[:, None] > self.s) * 1
-        if isinstance(trace, Dataset):
-            k = trace[self._param_name("k")][:, :, pool_group].values.reshape(1, -1)
-            m = trace[self._param_name("m")][:, :, pool_group].values.reshape(1, -1)
-            delta = trace[self._param_name("delta")][:, :, pool_group, :].values.reshape(-1, self.n_changepoints)
+    def _design(self, X):
+        t = X["t"]
+        design = {"t": t, "group": self._group_codes(X)}
+        if self.engine == 'cumsum':
+            design["idx"] = self._changepoint_index(t)
         else:
-            k = trace[self._param_name("k")][pool_group]
-            m = trace[self._param_name("m")][pool_group]
-            delta = trace[self._param_name("delta")][pool_group, :].reshape(-1, self.n_changepoints)
-        growth = k + A @ delta.T
-        gamma = -self.s[:, None] * delta.T
-        offset = m + A @ gamma
-        result = growth * t[:, None] + offset
-        return result
+            design["A"] = self._changepoint_matrix(t)
+        return design
+
+    @staticmethod
+    def _cumulative(x, xp):
+        """Cumulative sums over the changepoints on the last axis of ``x``, starting with 0."""
+        zeros = xp.zeros_like(x[..., :1])
+        return xp.concatenate([zeros, xp.cumsum(x, axis=-1)], axis=-1)
+
+    def _changepoint_index(self, t):
+        """Number of changepoints strictly before each element of ``t``."""
+        return self._basis_cache.get(t, lambda t: np.searchsorted(self.s, t, side='left'))
+
+    def _changepoint_matrix(self, t):
+        return self._basis_cache.get(t, lambda t: (t[:, None] > self.s) * 1.0)
+
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        t = self._get_t(t)
+        k = get_posterior(trace, self._param_name("k"))
+        m = get_posterior(trace, self._param_name("m"))
+        delta = get_posterior(trace, self._param_name("delta"))
+        if self.engine == 'dense':
+            # (k + A delta) t + m + A (-s delta) as a single product of [A (t - s), t, 1] and [delta, k, m]
+            X = np.column_stack([self._changepoint_matrix(t) * (t[:, None] - self.s), t, np.ones_like(t)])
+            return group_dot(X, np.concatenate([delta, k[..., None], m[..., None]], axis=-1), pool_group)
+
+        idx = self._changepoint_index(t)
+        growth = np.ascontiguousarray(self._cumulative(delta, np)[:, pool_group, idx].T)
+        offset = np.ascontiguousarray(self._cumulative(-self.s * delta, np)[:, pool_group, idx].T)
+        # (k + growth) * t + m + offset, in place to keep only two prediction matrices alive
+        growth += take_group(k, pool_group)
+        growth *= t[:, None]
+        growth += take_group(m, pool_group)
+        growth += offset
+        return growth
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = drawer.add_subplot()
@@ -90,4 +132,5 @@ class LinearTrend(TimeSeriesModel):
     def __repr__(self):
         return f"LinearTrend(n_changepoints={self.n_changepoints}, " \
                f"changepoints_prior_scale={self.changepoints_prior_scale}, " \
-               f"growth_prior_scale={self.growth_prior_scale})"
+               f"growth_prior_scale={self.growth_prior_scale}, " \
+               f"engine={self.engine})"
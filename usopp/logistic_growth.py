@@ -1,12 +1,11 @@
 import numpy as np
-import pytensor.tensor as pt
-import pytensor
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
-import pymc as pm
+from usopp.utils import add_subplot, get_posterior, group_dot, take_group
 
 
 class LogisticGrowth(TimeSeriesModel):
+    _predict_params = ("k", "m", "delta")
+
     def __init__(
             self, capacity: float, name: str = None, n_changepoints=None,
             changepoints_prior_scale=0.05, growth_prior_scale=1, pool_cols=None,
@@ -22,32 +21,17 @@ class LogisticGrowth(TimeSeriesModel):
         super().__init__()
 
     def definition(self, model, X, scale_factor):
+        import pymc as pm
+        import pytensor.tensor as pt
 
-        def update_gamma(j, gamma, i, delta, offset, rate, change_point):
-            return pt.set_subtensor(
-                gamma[i, j],
-                (change_point[j] - offset[i] - pt.sum(gamma[i, :j])) *
-                (1 - (rate[i] + pt.sum(delta[i, :j])) / (rate[i] + pt.sum(delta[i, :j+1])))
-                )
-
-        def get_gamma(i, gamma_init, delta, m, k, s):
-            gamma, _ = pytensor.scan(
-              update_gamma,
-              sequences=[
-                  pt.arange(gamma_init.shape[1]),
-              ],
-              outputs_info=gamma_init,
-              non_sequences=[i, delta, m, k, s],
-            )
-            return gamma[-1]
-
-        t = X["t"].values
         self.cap_scaled = self._y_scaler_.transform(self.cap)
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
-        self.s = np.linspace(0, np.max(t), self.n_changepoints + 2)[1:-1]
+        n_groups = self._group_definition(X)
+        self.s = np.linspace(0, np.max(X["t"]), self.n_changepoints + 2)[1:-1]
+        self._basis_cache.clear()
+        data = self._register_data(model, self._design(X))
+        t, group, A = data["t"], data["group"], data["A"]
 
         with model:
-            A = (t[:, None] > self.s) * 1.0
 
             if self.pool_type == 'partial':
                 sigma_k = pm.HalfCauchy(self._param_name('sigma_k'), beta=self.growth_prior_scale)
@@ -70,46 +54,54 @@ class LogisticGrowth(TimeSeriesModel):
 
             m = pm.Normal(self._param_name("m"), 0, 5, shape=n_groups)
 
-            gamma_init = pt.zeros_like(delta)
-            gamma, _ = pytensor.scan(
-                get_gamma,
-                sequences=[pt.arange(gamma_init.shape[0])],
-                outputs_info=gamma_init,
-                non_sequences=[delta, m, k, self.s],
-            )
-            gamma = gamma[-1]
+            gamma = self._gamma(k, m, delta, self.s, pt)
             growth = (
-                (k[group] + pm.math.sum(A * delta[group], axis=1)) *
-                (t - (m[group] + pm.math.sum(A * gamma[group], axis=1)))
+                (k[group] + self._segment_dot(A, delta, group)) *
+                (t - (m[group] + self._segment_dot(A, gamma, group)))
             )
             growth = self.cap_scaled / (1 + pm.math.exp(-growth))
         return growth
 
-    def _predict(self, trace, t, pool_group=0):
-        t = t.squeeze()
-        delta = trace[self._param_name("delta")]
-        if isinstance(delta, np.ndarray):
-            delta = delta[pool_group].reshape(1, self.n_changepoints)
-            k = trace[self._param_name("k")][pool_group]
-            m = trace[self._param_name("m")][pool_group]
-            gamma = np.zeros(delta.T.shape)
-        else:
-            delta = delta.values[:, :, pool_group, :].reshape(-1, self.n_changepoints)
-            k = trace[self._param_name("k")].values[:, :, pool_group].reshape(1, -1)
-            m = trace[self._param_name("m")].values[:, :, pool_group].reshape(1, -1)
-            gamma = np.zeros(delta.T.shape)
-
-        A = (t[:, None] > self.s) * 1
-        
-        for i in range(gamma.shape[0]):
-            gamma[i] = (
-                (self.s[i] - m - gamma[:i].sum(axis=0)) * (1 - ((k + delta[:, :i].sum(axis=1)) / (k + delta[:, :i+1].sum(axis=1))))
-            )
-        g = (
-            (k + A @ delta.T) *
-            (t[:, None] - (m + A @ gamma))
-        )
-        return self.cap_scaled / (1 + np.exp(-g))
+    def _design(self, X):
+        t = X["t"]
+        return {"t": t, "group": self._group_codes(X), "A": self._changepoint_matrix(t)}
+
+    @staticmethod
+    def _gamma(k, m, delta, s, xp):
+        """
+        Offset adjustments that keep the logistic curve continuous at the changepoints.
+
+        Writing the rate after ``i`` changepoints as ``k_i = k + sum(delta[:i])`` and the
+        offset as ``m_i = m + sum(gamma[:i])``, continuity at ``s_i`` gives
+        ``k_{i+1} * m_{i+1} = k_i * m_i + s_i * delta_i``, so all offsets follow from
+        cumulative sums. ``xp`` is ``numpy`` or ``pytensor.tensor`` and the changepoints
+        are on the last axis of ``delta``.
+        """
+        k, m = k[..., None], m[..., None]
+        rate = k + xp.cumsum(delta, axis=-1)
+        offset = (k * m + xp.cumsum(s * delta, axis=-1)) / rate
+        return offset - xp.concatenate([m, offset[..., :-1]], axis=-1)
+
+    def _changepoint_matrix(self, t):
+        return self._basis_cache.get(t, lambda t: (t[:, None] > self.s) * 1.0)
+
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        t = self._get_t(t)
+        delta = get_posterior(trace, self._param_name("delta"))
+        k = get_posterior(trace, self._param_name("k"))
+        m = get_posterior(trace, self._param_name("m"))
+        gamma = self._gamma(k, m, delta, self.s, np)
+        A = self._changepoint_matrix(t)
+        # cap / (1 + exp(-(k + A delta) * (t - (m + A gamma)))), in place
+        g = group_dot(A, gamma, pool_group)
+        g += take_group(m, pool_group)
+        np.subtract(t[:, None], g, out=g)
+        g *= group_dot(A, delta, pool_group) + take_group(k, pool_group)
+        np.negative(g, out=g)
+        np.exp(g, out=g)
+        g += 1
+        return np.divide(self.cap_scaled, g, out=g)
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = add_subplot()
@@ -0,0 +1,122 @@
+"""
+PyTensor ops for the model graphs. This module imports pytensor, components import it
+inside ``definition``.
+"""
+import numpy as np
+import pytensor.tensor as pt
+from pytensor.gradient import DisconnectedType
+from pytensor.graph.basic import Apply
+from pytensor.graph.op import Op
+from pytensor.scalar import upcast
+
+# rows per chunk when gathering the weights of interleaved groups
+CHUNK_SIZE = 4096
+
+
+def _blocks(node, codes, n_groups):
+    """
+    Returns the row bounds of each group if the rows are sorted by group, else None. The
+    bounds are kept on ``node`` until its ``codes`` input is given a new array. Raises if a
+    code is not the index of one of the ``n_groups`` groups.
+    """
+    cached = getattr(node.tag, "blocks", None)
+    if cached is None or cached[0] is not codes or cached[1] != n_groups:
+        if len(codes) and (codes.min() < 0 or codes.max() >= n_groups):
+            raise ValueError(f"group codes must be in [0, {n_groups}), got [{codes.min()}, {codes.max()}]")
+        bounds = None
+        if np.all(codes[1:] >= codes[:-1]):
+            bounds = np.searchsorted(codes, np.arange(n_groups + 1))
+        node.tag.blocks = cached = (codes, n_groups, bounds)
+    return cached[2]
+
+
+class SegmentDot(Op):
+    """
+    ``sum(M * W[codes], axis=1)`` without materializing ``W[codes]``. Rows sorted by group
+    are computed as one matrix-vector product per group block, interleaved rows gather
+    ``W[codes]`` for ``CHUNK_SIZE`` rows at a time.
+    """
+    __props__ = ()
+
+    def make_node(self, M, W, codes):
+        M, W, codes = pt.as_tensor(M), pt.as_tensor(W), pt.as_tensor(codes)
+        dtype = upcast(M.dtype, W.dtype)
+        return Apply(self, [M, W, codes], [pt.vector(dtype=dtype)])
+
+    def perform(self, node, inputs, output_storage):
+        M, W, codes = inputs
+        out = np.empty(len(M), dtype=node.outputs[0].dtype)
+        bounds = _blocks(node, codes, len(W))
+        if bounds is None:
+            for start in range(0, len(M), CHUNK_SIZE):
+                rows = slice(start, start + CHUNK_SIZE)
+                np.einsum("rp,rp->r", M[rows], W[codes[rows]], out=out[rows])
+        else:
+            for g in range(len(W)):
+                np.dot(M[bounds[g]:bounds[g + 1]], W[g], out=out[bounds[g]:bounds[g + 1]])
+        output_storage[0][0] = out
+
+    def infer_shape(self, fgraph, node, shapes):
+        return [shapes[0][:1]]
+
+    def connection_pattern(self, node):
+        return [[True], [True], [False]]
+
+    def grad(self, inputs, output_grads):
+        M, W, codes = inputs
+        (g,) = output_grads
+        return [W[codes] * g[:, None], SegmentSum()(M, g, codes, W.shape[0]), DisconnectedType()()]
+
+
+class SegmentSum(Op):
+    """
+    Sums the rows of ``M`` weighted by ``v`` per group in ``codes``, the gradient of
+    ``SegmentDot`` for ``W``. Rows sorted by group are one vector-matrix product per group
+    block, interleaved rows one sparse product with the weighted group indicator matrix.
+    """
+    __props__ = ()
+
+    def make_node(self, M, v, codes, n_groups):
+        M, v = pt.as_tensor(M), pt.as_tensor(v)
+        codes, n_groups = pt.as_tensor(codes), pt.as_tensor(n_groups)
+        dtype = upcast(M.dtype, v.dtype)
+        return Apply(self, [M, v, codes, n_groups], [pt.matrix(dtype=dtype)])
+
+    def perform(self, node, inputs, output_storage):
+        from scipy import sparse
+
+        M, v, codes, n_groups = inputs
+        dtype = node.outputs[0].dtype
+        bounds = _blocks(node, codes, n_groups)
+        if bounds is None:
+            indicator = sparse.csr_matrix((v, (codes, np.arange(len(codes)))), shape=(n_groups, len(codes)))
+            out = np.asarray(indicator @ M)
+        else:
+            out = np.empty((n_groups, M.shape[1]), dtype=dtype)
+            for g in range(n_groups):
+                np.dot(v[bounds[g]:bounds[g + 1]], M[bounds[g]:bounds[g + 1]], out=out[g])
+        output_storage[0][0] = out.astype(dtype, copy=False)
+
+    def infer_shape(self, fgraph, node, shapes):
+        return [(node.inputs[3], shapes[0][1])]
+
+    def connection_pattern(self, node):
+        return [[True], [True], [False], [False]]
+
+    def grad(self, inputs, output_grads):
+        M, v, codes, n_groups = inputs
+        (g,) = output_grads
+        return [g[codes] * v[:, None], SegmentDot()(M, g, codes), DisconnectedType()(), DisconnectedType()()]
+
+
+def segment_dot(M, W, codes, complete=False, custom_ops=True):
+    """
+    Returns ``sum(M * W[codes], axis=1)`` for a design matrix ``M`` and per group weights
+    ``W``. With ``complete`` pooling there is a single group and it is a plain dot product.
+    Without ``custom_ops`` it is the gather graph, which the JAX and numba backends compile.
+    """
+    if complete:
+        return pt.dot(M, W[0])
+    if not custom_ops:
+        return (pt.as_tensor(M) * pt.as_tensor(W)[codes]).sum(axis=1)
+    return SegmentDot()(M, W, codes)
@@ -0,0 +1,80 @@
+import numpy as np
+from pymc.blocking import DictToArrayBijection, RaveledVars
+from pymc.util import get_default_varnames
+from scipy.optimize import minimize
+
+# arguments of pm.find_MAP that select what is optimized or returned, which fit can't use
+_UNSUPPORTED = ("vars", "return_raw", "model")
+
+
+class MAPOptimizer:
+    """
+    Maximum a posteriori estimation like ``pm.find_MAP``, but the logp, gradient and
+    output functions are compiled once. Calling the optimizer again after swapping the
+    data of the model with ``pm.set_data`` reuses the compiled functions.
+    """
+    def __init__(self, model):
+        self.model = model
+        self._initial_point = model.initial_point()
+        value_vars = {var.name: var for var in model.continuous_value_vars}
+        self._x0 = DictToArrayBijection.map(
+            {name: value for name, value in self._initial_point.items() if name in value_vars}
+        )
+        rvs = [model.values_to_rvs[value_vars[name]] for name, _, _, _ in self._x0.point_map_info]
+        self._logp = DictToArrayBijection.mapf(model.compile_logp(jacobian=False), self._initial_point)
+        self._dlogp = DictToArrayBijection.mapf(model.compile_dlogp(rvs, jacobian=False), self._initial_point)
+
+        outputs = get_default_varnames(model.unobserved_value_vars, include_transformed=True)
+        self._output_names = [var.name for var in outputs]
+        self._untransformed_names = {
+            var.name for var in get_default_varnames(model.unobserved_value_vars, include_transformed=False)
+        }
+        self._outputs = model.compile_fn(inputs=model.value_vars, outs=outputs)
+        self.n_evals_ = 0
+
+    def __call__(
+        self, start=None, method="L-BFGS-B", maxeval=5000, include_transformed=True, seed=None, progressbar=None,
+        progressbar_theme=None, **kwargs
+    ):
+        """
+        Runs the optimization from ``start`` (values of the transformed variables, like the
+        ones returned by a previous call) or the initial point of the model, drawn with
+        ``seed`` for variables with random initial values. ``include_transformed``,
+        ``seed`` and ``maxeval`` work like in ``pm.find_MAP``, ``progressbar`` and
+        ``progressbar_theme`` are accepted and ignored. The other arguments of ``find_MAP``
+        raise a ``TypeError``, the remaining keyword arguments are passed to
+        ``scipy.optimize.minimize``.
+        """
+        unsupported = [name for name in kwargs if name in _UNSUPPORTED]
+        if unsupported:
+            raise TypeError(f"the MAP optimizer doesn't support the pm.find_MAP arguments {', '.join(unsupported)}")
+        point = dict(self._initial_point if seed is None else self.model.initial_point(random_seed=seed))
+        if start is not None:
+            point.update({name: value for name, value in start.items() if name in point})
+        x0 = DictToArrayBijection.map({name: point[name] for name, _, _, _ in self._x0.point_map_info})
+
+        self.n_evals_ = 0
+        last_finite = x0.data
+
+        def cost(x):
+            nonlocal last_finite
+            self.n_evals_ += 1
+            if self.n_evals_ > maxeval:
+                raise StopIteration
+            raveled = RaveledVars(x.astype(x0.data.dtype, copy=False), x0.point_map_info)
+            grad = self._dlogp(raveled)
+            if np.all(np.isfinite(grad)):
+                last_finite = x
+            return -np.float64(self._logp(raveled)), -grad.astype(np.float64)
+
+        try:
+            x = minimize(cost, x0.data, method=method, jac=True, **kwargs)["x"]
+        except StopIteration:
+            x = last_finite
+
+        x = x.astype(x0.data.dtype, copy=False)
+        values = self._outputs(DictToArrayBijection.rmap(RaveledVars(x, x0.point_map_info), point))
+        return {
+            name: value for name, value in zip(self._output_names, values)
+            if include_transformed or name in self._untransformed_names
+        }
@@ -0,0 +1,147 @@
+"""
+Opt-in instrumentation of ``fit``, ``refit``, ``update``, ``predict`` and ``plot_components``.
+
+Inside a ``Profiler`` context, every phase of these methods records its wall time, number
+of calls and peak memory, and the optimizers and samplers record how often they evaluated
+the log density and its gradient::
+
+    with Profiler() as profiler:
+        model.fit(X, y)
+        model.predict(X)
+    profiler.to_json()
+
+Phases are keyed by their path, e.g. ``fit/definition/LinearTrend(n_changepoints=10)``.
+Phases of other threads, e.g. of ``predict_iter`` with several workers, start a path of
+their own, and their peak memory is that of the whole process. Without an active
+profiler the hooks do nothing.
+"""
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Collects the phases and counters of the instrumented methods called in its context.
+    With ``trace_memory``, peak memory is measured with ``tracemalloc``, which slows down
+    the profiled code.
+    """
+    _profilers = []
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.counters = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._profilers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profilers.pop()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @classmethod
+    def get_profiler(cls):
+        return cls._profilers[-1] if cls._profilers else None
+
+    @property
+    def _stack(self):
+        """The phases entered by the current thread."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _path(self, name):
+        return f"{self._stack[-1]['path']}/{name}" if self._stack else name
+
+    def _memory(self):
+        return tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+    @contextmanager
+    def phase(self, name):
+        """Records the wall time and peak memory of the block as phase ``name``."""
+        current, peak = self._memory()
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        frame = {"path": self._path(name), "base": current, "peak": current}
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            frame["peak"] = max(frame["peak"], self._memory()[1])
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], frame["peak"])
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+
+            with self._lock:
+                record = self.phases.setdefault(frame["path"], {"calls": 0, "seconds": 0.0, "peak_memory": 0})
+                record["calls"] += 1
+                record["seconds"] += seconds
+                record["peak_memory"] = max(record["peak_memory"], frame["peak"] - frame["base"])
+
+    def count(self, name, value):
+        """Adds ``value`` to the counter ``name`` of the current phase."""
+        path = self._path(name)
+        with self._lock:
+            self.counters[path] = self.counters.get(path, 0) + value
+
+    def to_dict(self):
+        """
+        Returns ``{"phases": {path: {"calls", "seconds", "peak_memory"}}, "counters": {path: n}}``,
+        with ``peak_memory`` in bytes above the memory in use when the phase started.
+        """
+        return {
+            "phases": {path: dict(record) for path, record in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self, **kwargs):
+        """Returns ``to_dict`` as JSON, ``kwargs`` are passed to ``json.dumps``."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+@contextmanager
+def profile(name):
+    """Records the block as phase ``name`` of the active profiler, if any."""
+    profiler = Profiler.get_profiler()
+    if profiler is None:
+        yield
+    else:
+        with profiler.phase(name):
+            yield
+
+
+def count(name, value):
+    """Adds ``value`` to the counter ``name`` of the active profiler, if any."""
+    profiler = Profiler.get_profiler()
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+def profiled(name):
+    """Decorator recording every call of a method as phase ``name``."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with profile(name):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,8 +1,7 @@
 import numpy as np
 import pandas as pd
-import pymc as pm
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition, get_periodic_peaks
+from usopp.utils import add_subplot, get_periodic_peaks, get_posterior, group_dot
 
 
 class RBFSeasonality(TimeSeriesModel):
@@ -11,7 +10,14 @@ class RBFSeasonality(TimeSeriesModel):
     are placed to model seasonality. With ``peaks`` argument, RBF's can be placed
     arbitrarily. If peaks is not provided, 20 evenly placed RBF's are used
     evenly spread out over `period` days
+
+    With ``truncate``, the kernels are cut off at ``truncate`` times ``sigma`` from their
+    peak and the basis is stored sparsely: every row holds the values and peak indices of
+    the kernels that reach it, so fitting and predicting scale with the number of
+    non-zeros instead of the number of peaks. This pays off with many narrow peaks.
     """
+    _predict_params = ("beta",)
+
     def __init__(
         self,
         name: str = None,
@@ -21,7 +27,8 @@ class RBFSeasonality(TimeSeriesModel):
         shrinkage_strength=100,
         pool_cols=None,
         sigma=0.1,
-        pool_type='complete'
+        pool_type='complete',
+        truncate=None,
     ):
         if peaks is None:
             self.peaks = get_periodic_peaks(period=period, n=n_peaks)
@@ -30,6 +37,7 @@ class RBFSeasonality(TimeSeriesModel):
         self.period = period
         self.shrinkage_strength = shrinkage_strength
         self.sigma = sigma
+        self.truncate = truncate
         self.pool_cols = pool_cols
         self.pool_type = pool_type
         self.name = name or f"RBFSeasonality(period={self.period})"
@@ -38,17 +46,77 @@ class RBFSeasonality(TimeSeriesModel):
     @staticmethod
     def _X_t(t, peaks, sigma, year):
         mod = (t % year).reshape(-1, 1)
-        left_difference = np.sqrt((mod - peaks[None, :]) ** 2)
+        left_difference = np.abs(mod - peaks[None, :])
         right_difference = np.abs(year - left_difference)
         return np.exp(-((np.minimum(left_difference, right_difference)) ** 2) / (2 * sigma**2))
 
+    @staticmethod
+    def _band_width(peaks, year, width):
+        """Returns the largest number of peaks within ``width`` of a point of the period."""
+        peaks = np.sort(peaks % year)
+        extended = np.concatenate([peaks, peaks + year])
+        return int(np.max(np.searchsorted(extended, peaks + 2 * width) - np.arange(len(peaks))))
+
+    @staticmethod
+    def _sparse_X_t(t, peaks, sigma, year, width, n_band):
+        """
+        Returns the kernels within ``width`` of their peak as a CSR matrix with ``n_band``
+        stored entries per row, padded with zeros.
+        """
+        from scipy import sparse
+
+        mod = t % year
+        order = np.argsort(peaks % year, kind="stable")
+        sorted_peaks = (peaks % year)[order]
+        # the peaks of the neighbouring periods, so that windows wrap around
+        extended = np.concatenate([sorted_peaks - year, sorted_peaks, sorted_peaks + year])
+        columns = np.tile(order, 3)
+
+        start = np.searchsorted(extended, mod - width)
+        stop = np.searchsorted(extended, mod + width)
+        index = start[:, None] + np.arange(n_band)
+        valid = index < stop[:, None]
+        index = np.minimum(index, len(extended) - 1)
+        values = np.where(valid, np.exp(-((mod[:, None] - extended[index]) ** 2) / (2 * sigma**2)), 0.0)
+        indices = np.where(valid, columns[index], 0)
+        indptr = np.arange(0, len(t) * n_band + 1, n_band)
+        return sparse.csr_matrix(
+            (values.ravel(), indices.ravel(), indptr), shape=(len(t), len(peaks))
+        )
+
+    def _basis(self, t):
+        if self.truncate is None:
+            return self._basis_cache.get(t, lambda t: self._X_t(t, self.peaks_, self.sigma, self.p_))
+        return self._basis_cache.get(
+            t, lambda t: self._sparse_X_t(t, self.peaks_, self.sigma, self.p_, self.width_, self.n_band_)
+        )
+
+    def _design(self, X):
+        basis = self._basis(X["t"])
+        if self.truncate is None:
+            return {"X_t": basis, "group": self._group_codes(X)}
+        # every row has n_band_ entries, so the CSR arrays reshape to row aligned matrices
+        return {
+            "X_values": basis.data.reshape(-1, self.n_band_),
+            "X_columns": basis.indices.reshape(-1, self.n_band_),
+            "group": self._group_codes(X),
+        }
+
     def definition(self, model, X, scale_factor):
-        t = X["t"].values
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
+        import pymc as pm
+
+        n_groups = self._group_definition(X)
         self.p_ = self.period / scale_factor['t']
         self.peaks_ = self.peaks / scale_factor['t']
         n_params = len(self.peaks)
         self.factor_ = scale_factor["t"]
+        if self.truncate is not None:
+            # beyond half a period the kernels would reach a peak twice
+            self.width_ = min(self.truncate * self.sigma, self.p_ / 2)
+            self.n_band_ = self._band_width(self.peaks_, self.p_, self.width_)
+        self._basis_cache.clear()
+        data = self._register_data(model, self._design(X))
+        group = data["group"]
         with model:
             if self.pool_type == 'partial':
 
@@ -61,17 +129,41 @@ class RBFSeasonality(TimeSeriesModel):
             else:
                 beta = pm.Normal(self._param_name("beta"), 0, 1, shape=(n_groups, n_params))
 
-            seasonality = pm.math.sum(self._X_t(t, self.peaks_, self.sigma, self.p_) * beta[group], axis=1)
+            if self.truncate is None:
+                seasonality = self._segment_dot(data["X_t"], beta, group)
+            else:
+                seasonality = self._sparse_dot(
+                    data["X_values"], data["X_columns"], beta, group, custom_ops=self._custom_ops()
+                )
 
         return seasonality
 
-    def _predict(self, trace, t, pool_group=0):
-        beta = trace[self._param_name("beta")]
+    @staticmethod
+    def _sparse_dot(values, columns, beta, group, custom_ops=True):
+        """
+        Graph of the row-wise dot product of the banded basis with ``beta[group]``. The
+        basis becomes a CSR matrix over the parameters of all groups, with the columns of
+        each row shifted to its group, so the product costs one operation per non-zero.
+        Without ``custom_ops`` the non-zeros gather their parameters instead, as the JAX
+        and numba backends don't compile sparse ops.
+        """
+        import pytensor.tensor as pt
+        from pytensor import sparse
 
-        if isinstance(beta, np.ndarray):
-            return self._X_t(t, self.peaks_, self.sigma, self.p_) @ beta[pool_group, :].reshape(-1, len(self.peaks)).T
-        else:
-            return self._X_t(t, self.peaks_, self.sigma, self.p_) @ beta.values[:, :, pool_group, :].reshape(-1, len(self.peaks)).T
+        if not custom_ops:
+            return (values * beta[group[:, None], columns]).sum(axis=1)
+        n_rows, n_band = values.shape
+        n_params = beta.shape[1]
+        indices = columns + group[:, None] * n_params
+        indptr = pt.arange(0, n_rows * n_band + 1, n_band)
+        X = sparse.CSR(values.ravel(), indices.ravel(), indptr, pt.stack([n_rows, beta.size]))
+        return sparse.structured_dot(X, beta.reshape((-1, 1)))[:, 0]
+
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        t = self._get_t(t)
+        beta = get_posterior(trace, self._param_name("beta"))
+        return group_dot(self._basis(t), beta, pool_group)
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = drawer.add_subplot()
@@ -1,10 +1,12 @@
 import numpy as np
+from usopp.config import get_float_dtype
 from usopp.timeseries_model import TimeSeriesModel
-from usopp.utils import add_subplot, get_group_definition
-import pymc as pm
-from xarray.core.dataset import Dataset
+from usopp.utils import add_subplot, get_posterior, group_dot
+
 
 class Regressor(TimeSeriesModel):
+    _predict_params = ("k",)
+
     def __init__(self, on: str, scale: float = 1., name: str = None, pool_cols=None, pool_type='complete'):
         self.on = on
         self.scale = scale
@@ -16,10 +18,13 @@ class Regressor(TimeSeriesModel):
         super().__init__()
 
     def definition(self, model, X, scale_factor):
-        self.feature_indices_ = X.columns.get_indexer(self.on)
+        import pymc as pm
+
         self.shape_ = len(self.on)
 
-        group, n_groups, self.groups_ = get_group_definition(X, self.pool_cols, self.pool_type)
+        n_groups = self._group_definition(X)
+        data = self._register_data(model, self._design(X))
+        features, group = data["X"], data["group"]
         with model:
             if self.pool_type == "partial":
                 sigma_k = pm.HalfCauchy(self._param_name('sigma_k'), beta=self.scale)
@@ -28,18 +33,22 @@ class Regressor(TimeSeriesModel):
 
             else:
                 k = pm.Normal(self._param_name('k'), mu=0, sigma=self.scale, shape=(n_groups, self.shape_))
-        return pm.math.sum(X[self.on].values * k[group], axis=1)
-
-    def _predict(self, trace, t, pool_group=0):
-        if isinstance(trace, Dataset):
-            k = trace[self._param_name("k")][:, :, pool_group, :].values.reshape(self.shape_, -1)
-        else:
-            k = trace[self._param_name("k")][pool_group, :]
-        X = t[:, self.feature_indices_]
-        result = X @ k
-        if result.ndim == 1:
-            result = result[:, np.newaxis]
-        return result
+        return self._segment_dot(features, k, group)
+
+    def _features(self, X):
+        """Returns the ``on`` columns of ``X`` side by side, in the float dtype."""
+        features = np.empty((len(X), len(self.on)), dtype=get_float_dtype())
+        for i, name in enumerate(self.on):
+            features[:, i] = X[name]
+        return features
+
+    def _design(self, X):
+        return {"X": self._features(X), "group": self._group_codes(X)}
+
+    def _predict(self, trace, t, pool_group=None):
+        pool_group = self._get_pool_group(t, pool_group)
+        k = get_posterior(trace, self._param_name("k"))
+        return group_dot(self._features(t), k, pool_group)
 
     def plot(self, trace, scaled_t, y_scaler, drawer):
         ax = drawer.add_subplot()
@@ -0,0 +1,69 @@
+"""
+Compact on-disk format for fitted models.
+
+A saved model is a directory with
+
+* ``metadata.json``: format version, number of draws over all chains and the file, dtype
+  and shape of every posterior variable,
+* ``model.pkl``: the fitted model without its trace and PyMC model, i.e. the scalers and
+  the fitted attributes of the components,
+* ``posterior/<i>.npy``: one contiguous array per variable needed for prediction, with
+  the draws of all chains flattened on the leading axis.
+
+The posterior arrays are memory-mapped when loading, so worker processes loading the
+same model share the posterior memory through the page cache.
+"""
+import copy
+import json
+import os
+import pickle
+
+import numpy as np
+
+from usopp.utils import Posterior, get_draw_shape, get_posterior
+
+FORMAT_VERSION = 1
+
+
+def save_model(model, path, dtype=None):
+    """
+    Saves the fitted ``model`` to the directory ``path``. With ``dtype``, e.g.
+    ``"float32"``, the posterior arrays are stored in that dtype.
+    """
+    os.makedirs(os.path.join(path, "posterior"), exist_ok=True)
+
+    variables = {}
+    for i, name in enumerate(model._trace_names()):
+        values = np.ascontiguousarray(get_posterior(model.trace_, name), dtype=dtype)
+        file = os.path.join("posterior", f"{i}.npy")
+        np.save(os.path.join(path, file), values)
+        variables[name] = {"file": file, "dtype": values.dtype.str, "shape": list(values.shape)}
+
+    skeleton = copy.copy(model)
+    del skeleton.trace_
+    with open(os.path.join(path, "model.pkl"), "wb") as f:
+        pickle.dump(skeleton, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    n_chains, n_draws = get_draw_shape(model.trace_)
+    metadata = {"format_version": FORMAT_VERSION, "n_draws": n_chains * n_draws, "variables": variables}
+    with open(os.path.join(path, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def load_model(path, mmap=True):
+    """
+    Loads a model saved with ``save_model``. The posterior arrays are memory-mapped
+    read-only unless ``mmap=False``.
+    """
+    with open(os.path.join(path, "metadata.json")) as f:
+        metadata = json.load(f)
+    if metadata["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"unsupported format version {metadata['format_version']}, expected {FORMAT_VERSION}")
+
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    model.trace_ = Posterior({
+        name: np.load(os.path.join(path, variable["file"]), mmap_mode="r" if mmap else None)
+        for name, variable in metadata["variables"].items()
+    })
+    return model
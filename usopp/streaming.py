@@ -0,0 +1,41 @@
+"""
+Reading and writing prediction frames in chunks, for ``TimeSeriesModel.predict_iter``.
+Parquet needs ``pyarrow``, install it with ``pip install usopp[parquet]``.
+"""
+
+
+def iter_parquet(path, batch_size=65_536, columns=None):
+    """
+    Yields the rows of the parquet file or directory of parquet files ``path`` as
+    DataFrames of at most ``batch_size`` rows, with only ``columns`` if given.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet")
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def write_parquet(frames, path, index=False):
+    """
+    Writes the DataFrames ``frames``, e.g. the predictions of ``predict_iter``, to the
+    parquet file ``path`` one at a time, so only one frame is in memory. With ``index``
+    the index is written as a column. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    n_rows = 0
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=True if index else False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            n_rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
@@ -1,43 +1,310 @@
+import os
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import nullcontext
 
 import pandas as pd
 import numpy as np
-import pymc as pm
 
+from usopp.config import float_dtype, get_float_dtype, pytensor_config
 from usopp.utils import MinMaxScaler, MaxScaler, add_subplot
+from usopp.context import FitContext, group_layout
 from usopp.likelihood import Gaussian
-from usopp.utils import Drawer
+from usopp.profiling import count, profile, profiled
+from usopp.utils import (
+    BasisCache, Columns, Drawer, get_draw_shape, get_group_codes, get_posterior, slice_draws, uncached_bases,
+)
 
+FIT_METHODS = ("map", "mcmc", "advi", "fullrank_advi")
+# NUTS samplers ``pm.sample`` can use and the packages each one needs
+SAMPLER_BACKENDS = {
+    "pymc": (),
+    "nutpie": ("nutpie",),
+    "numpyro": ("jax", "numpyro"),
+    "blackjax": ("jax", "blackjax"),
+}
 
-class TimeSeriesModel(ABC):
-    def fit(self, X, y, X_scaler=MinMaxScaler, y_scaler=MaxScaler, likelihood=None, use_mcmc=False, **sample_kwargs):
-        if not X.index.is_monotonic_increasing:
-            raise ValueError('index of X is not monotonically increasing. You might want to call `.reset_index()`')
 
-        X_to_scale = X[["t"]]
+class TimeSeriesModel(ABC):
+    # names of the trace variables _predict reads
+    _predict_params = ()
+
+    def __init__(self):
+        self._basis_cache = BasisCache()
+
+    @profiled("fit")
+    def fit(
+        self, X, y, X_scaler=MinMaxScaler, y_scaler=MaxScaler, likelihood=None, use_mcmc=False, method=None,
+        batch_size=None, backend="pymc", **sample_kwargs
+    ):
+        """
+        Fits the model to ``X`` and ``y``. ``method`` is one of
+
+        * ``"map"`` (default): maximum a posteriori point estimate,
+        * ``"mcmc"``: NUTS with ``pm.sample``, same as ``use_mcmc=True``,
+        * ``"advi"`` or ``"fullrank_advi"``: variational inference with ``pm.fit``, the trace
+          holds ``draws`` (default 1000) samples of the fitted approximation.
+
+        With ``batch_size``, which needs one of the ADVI methods, every optimization step
+        evaluates the model on a random minibatch of ``batch_size`` rows, with the likelihood
+        scaled to the number of rows of ``X``. Only this ``pm.fit`` call uses minibatches,
+        ``refit`` and ``update`` evaluate the model on all rows.
+
+        ``backend`` picks the NUTS sampler for ``"mcmc"``: ``"pymc"``, ``"nutpie"``,
+        ``"numpyro"`` or ``"blackjax"``. A backend that isn't installed falls back to
+        ``"pymc"`` with a warning. ``refit`` and ``update`` use the backend of ``fit``. The
+        graph of the other backends gathers the parameters of each row's group instead of
+        using the custom ops of ``usopp.ops``, which JAX and numba can't compile.
+
+        ``sample_kwargs`` are passed to ``pm.sample``, ``pm.fit`` or for ``"map"`` to
+        ``usopp.optimize.MAPOptimizer``. It takes the arguments of ``pm.find_MAP`` except
+        ``vars``, ``return_raw`` and ``model``, and passes any others to
+        ``scipy.optimize.minimize``. The scipy method of ``"map"`` is ``optimizer_method``
+        (default ``"L-BFGS-B"``). Before ``method`` picked the fitting method, it was the
+        scipy method passed to ``pm.find_MAP``: ``method="BFGS"`` is now
+        ``optimizer_method="BFGS"``.
+
+        The data, design matrices and PyMC model use the float dtype of ``usopp.config``
+        at the time of the call, ``refit`` and ``update`` keep it.
+        """
+        method = self._fit_method(use_mcmc, method)
+        if batch_size is not None and method not in ("advi", "fullrank_advi"):
+            raise ValueError(f"batch_size needs method 'advi' or 'fullrank_advi', got {method!r}")
+        self._backend_ = self._sampler_backend(backend, method)
+        self._check_index(X)
         self._X_scaler_ = X_scaler()
         self._y_scaler_ = y_scaler()
+        self._float_dtype_ = get_float_dtype()
 
-        X_scaled = self._X_scaler_.fit_transform(X_to_scale)
-        y_scaled = self._y_scaler_.fit_transform(y)
-        model = pm.Model()
+        with profile("scale"):
+            self._X_scaler_.fit(X[["t"]])
+            X_scaled = self._scale(X)
+            y_scaled = self._y_scaler_.fit_transform(y)
 
-        X_scaled = X_scaled.join(
-            X.drop(columns=["t"], axis=1)
-        )
         del X
-        mu = self.definition(
-            model, X_scaled, self._X_scaler_.scale_factor_
-        )
         if likelihood is None:
             likelihood = Gaussian()
-        with model:
-            likelihood.observed(mu, y_scaled)
-            if use_mcmc:
-                self.trace_ = pm.sample(**sample_kwargs)["posterior"]
+        with pytensor_config():
+            # the samplers of the other backends compile the graph with JAX or numba
+            with FitContext(X_scaled, custom_ops=self._backend_ == "pymc"):
+                self._model_ = self._build_model(X_scaled, y_scaled, likelihood)
+                # the minibatch model only serves this pm.fit call, the kept model sees all rows
+                batch_model = None
+                if batch_size is not None:
+                    batch_model = self._build_model(X_scaled, y_scaled, likelihood, batch_size)
+            self._likelihood_ = likelihood
+            self._method_ = method
+            self._map_optimizer_ = None
+            self._sample(method, sample_kwargs, model=batch_model)
+
+    def _build_model(self, X_scaled, y_scaled, likelihood, batch_size=None):
+        """Returns the PyMC model of the components and ``likelihood``, on minibatches with ``batch_size``."""
+        import pymc as pm
+
+        model = pm.Model()
+        with profile("definition"):
+            mu = self._call("definition", model, X_scaled, self._X_scaler_.scale_factor_)
+        with profile("likelihood"), model:
+            y_data = pm.Data("y_scaled", np.asarray(y_scaled))
+            group = None
+            if likelihood.pool_cols is not None:
+                layout = FitContext.get_context().layout(likelihood.pool_cols, "unpooled")
+                likelihood.groups_ = layout.groups
+                group = pm.Data("likelihood_group", layout.codes)
+            if batch_size is None:
+                likelihood.observed(mu, y_data, group=group)
+            else:
+                (mu, group), y_data = self._minibatch(model, [mu, group], y_data, batch_size)
+                likelihood.observed(mu, y_data, total_size=len(y_scaled), group=group)
+        return model
+
+    @profiled("refit")
+    def refit(self, X, y, use_mcmc=None, method=None, **sample_kwargs):
+        """
+        Fits the model to new data without rebuilding it. The data containers of the model
+        built in ``fit`` are swapped for the new data and the compiled functions are reused.
+        The scalers, changepoints, periods and groups learned in ``fit`` are kept. Without
+        ``method`` or ``use_mcmc``, the method of ``fit`` is used.
+        """
+        import pymc as pm
+
+        self._check_refit("refit")
+        method = self._fit_method(use_mcmc, method, default=self._method_)
+        self._check_index(X)
+        with float_dtype(self._float_dtype_), pytensor_config():
+            with profile("scale"):
+                data = self._data(X, y)
+            pm.set_data(data, model=self._model_)
+            self._sample(method, sample_kwargs)
+
+    @profiled("update")
+    def update(self, X_new, y_new, use_mcmc=None, method=None, **sample_kwargs):
+        """
+        Appends ``X_new`` and ``y_new`` to the data of the last fit and fits the model again,
+        starting from the posterior mean (or MAP point) of the previous fit instead of the
+        default initial point. Like ``refit``, the scalers, changepoints, periods and groups
+        learned in ``fit`` are kept, the compiled functions are reused and the method of
+        ``fit`` is the default.
+        """
+        import pymc as pm
+
+        self._check_refit("update")
+        method = self._fit_method(use_mcmc, method, default=self._method_)
+        self._check_index(X_new)
+        with float_dtype(self._float_dtype_), pytensor_config():
+            with profile("scale"):
+                data = {
+                    name: np.concatenate([self._model_[name].get_value(), value])
+                    for name, value in self._data(X_new, y_new).items()
+                }
+            point = self._posterior_point()
+            pm.set_data(data, model=self._model_)
+            if method == "map":
+                sample_kwargs.setdefault("start", self._transformed_point(point))
+            elif method == "mcmc":
+                sample_kwargs.setdefault("initvals", point)
             else:
-                self.trace_ = pm.find_MAP(**sample_kwargs)
+                sample_kwargs.setdefault("start", point)
+            self._sample(method, sample_kwargs)
+
+    def _check_refit(self, name):
+        if getattr(self, "_model_", None) is None:
+            raise ValueError(f"{name} needs the PyMC model built by `fit` in this process, call `fit` first")
+
+    def _data(self, X, y):
+        """Returns the values of all data containers of the model for ``X`` and ``y``."""
+        X_scaled = self._scale(X)
+        data = {
+            component._param_name(name): value
+            for component in self._components()
+            for name, value in component._design(X_scaled).items()
+        }
+        data["y_scaled"] = np.asarray(self._y_scaler_.transform(y))
+        if self._likelihood_.pool_cols is not None:
+            data["likelihood_group"] = self._likelihood_._group_codes(X_scaled)
+        return data
+
+    def _posterior_point(self):
+        """Returns the posterior mean of the free variables of the model."""
+        return {
+            rv.name: get_posterior(self.trace_, rv.name).mean(axis=0)
+            for rv in self._model_.free_RVs
+        }
+
+    def _transformed_point(self, point):
+        from pymc.initial_point import make_initial_point_fn
+
+        return make_initial_point_fn(model=self._model_, overrides=point, jitter_rvs=set())(None)
+
+    @staticmethod
+    def _minibatch(model, outputs, y_data, batch_size):
+        """
+        Returns the ``outputs`` graphs, None entries left as is, and ``y_data`` on a random
+        minibatch of rows. All data containers are row aligned, they are swapped for
+        minibatches drawn with one shared index.
+        """
+        import pymc as pm
+        from pytensor.compile.sharedvalue import SharedVariable
+        from pytensor.graph.replace import graph_replace
+
+        data = [var for var in model.named_vars.values() if isinstance(var, SharedVariable) and var is not y_data]
+        *batches, y_batch = pm.Minibatch(*data, y_data, batch_size=batch_size)
+        replace = dict(zip(data, batches))
+        return [None if out is None else graph_replace(out, replace, strict=False) for out in outputs], y_batch
+
+    @staticmethod
+    def _sampler_backend(backend, method):
+        import importlib.util
+        import warnings
+
+        if backend not in SAMPLER_BACKENDS:
+            raise ValueError(f"backend must be one of {tuple(SAMPLER_BACKENDS)}, got {backend!r}")
+        if backend != "pymc" and method != "mcmc":
+            raise ValueError(f"backend {backend!r} needs method 'mcmc', got {method!r}")
+        missing = [package for package in SAMPLER_BACKENDS[backend] if importlib.util.find_spec(package) is None]
+        if missing:
+            warnings.warn(f"backend {backend!r} needs {', '.join(missing)}, falling back to 'pymc'")
+            return "pymc"
+        return backend
+
+    @staticmethod
+    def _fit_method(use_mcmc, method, default="map"):
+        if method is None:
+            if use_mcmc is None:
+                return default
+            return "mcmc" if use_mcmc else "map"
+        if method not in FIT_METHODS:
+            raise ValueError(
+                f"method must be one of {FIT_METHODS}, got {method!r}. "
+                "Pass the scipy method of the MAP optimizer as optimizer_method"
+            )
+        return method
+
+    def _sample(self, method, sample_kwargs, model=None):
+        """Fits ``model``, by default the model built in ``fit``, and sets ``trace_``."""
+        import pymc as pm
+        from usopp.optimize import MAPOptimizer
+
+        if "optimizer_method" in sample_kwargs:
+            if method != "map":
+                raise ValueError(f"optimizer_method needs method 'map', got {method!r}")
+            sample_kwargs["method"] = sample_kwargs.pop("optimizer_method")
+        with model or self._model_:
+            if method == "mcmc":
+                with profile("sample"):
+                    result = pm.sample(nuts_sampler=self._backend_, **sample_kwargs)
+                if "sample_stats" in result and "n_steps" in result["sample_stats"]:
+                    count("grad_evals", int(result["sample_stats"]["n_steps"].sum()))
+                with profile("trace"):
+                    posterior = result["posterior"]
+                    missing = [name for name in self._trace_names() if name not in posterior]
+                    if missing:
+                        posterior = posterior.merge(
+                            pm.compute_deterministics(posterior, var_names=missing, progressbar=False)
+                        )
+                self.trace_ = posterior
+            elif method in ("advi", "fullrank_advi"):
+                draws = sample_kwargs.pop("draws", 1000)
+                with profile("optimize"):
+                    approx = pm.fit(method=method, **sample_kwargs)
+                count("grad_evals", len(approx.hist))
+                with profile("trace"):
+                    self.trace_ = approx.sample(draws, random_seed=sample_kwargs.get("random_seed"))["posterior"]
+            else:
+                if self._map_optimizer_ is None:
+                    with profile("compile"):
+                        self._map_optimizer_ = MAPOptimizer(self._model_)
+                with profile("optimize"):
+                    self.trace_ = self._map_optimizer_(**sample_kwargs)
+                count("logp_evals", self._map_optimizer_.n_evals_)
+                count("grad_evals", self._map_optimizer_.n_evals_)
+
+    @staticmethod
+    def _check_index(X):
+        if not X.index.is_monotonic_increasing:
+            raise ValueError('index of X is not monotonically increasing. You might want to call `.reset_index()`')
 
+    def _scale(self, X):
+        """
+        Returns the ``Columns`` of ``X`` with ``t`` scaled. The other columns share the
+        memory of ``X`` where pandas allows.
+        """
+        return Columns.from_frame(X).assign(t=self._scale_t(X["t"]))
+
+    def _scale_t(self, t):
+        """Returns the time column ``t`` scaled, in the float dtype."""
+        dtype = get_float_dtype()
+        scaler = self._X_scaler_
+        if type(scaler) is MinMaxScaler and t.dtype.kind == "M":
+            # offsets in integer nanoseconds, scaled in place in a single float buffer
+            ns = t.to_numpy().astype("datetime64[ns]", copy=False).view("int64")
+            scaled = np.empty(len(ns), dtype=dtype)
+            np.subtract(ns, pd.Timestamp(scaler.min_["t"]).value, out=scaled)
+            scaled /= pd.Timedelta(scaler.scale_factor_["t"]).value
+            return scaled
+        return np.asarray(scaler.transform(t.to_frame("t"))["t"], dtype=dtype)
+
+    @profiled("plot_components")
     def plot_components(self, X_true=None, y_true=None, groups=None, fig=None):
         import matplotlib.pyplot as plt
 
@@ -49,7 +316,8 @@ class TimeSeriesModel(ABC):
         t_max += (t_max - t_min) * lookahead_scale
         t = pd.date_range(t_min, t_max, freq='D')
         scaled_t = np.linspace(0, 1 + lookahead_scale, len(t))
-        total = self.plot(self.trace_, scaled_t, self._y_scaler_, drawer)
+        with profile("components"):
+            total = self._call("plot", self.trace_, scaled_t, self._y_scaler_, drawer)
 
         ax = drawer.add_subplot()
         ax.set_title("overall")
@@ -65,29 +333,145 @@ class TimeSeriesModel(ABC):
         fig.tight_layout()
         return self._y_scaler_.inv_transform(total)
 
-    def predict(self, X, ci_percentiles=None):
-        X_to_scale = X[["t"]]
-
-        X_scaled = self._X_scaler_.transform(X_to_scale)
-        X_scaled = X_scaled.join(X.drop(columns=["t"], axis=1))
-        y_hat_scaled = self._predict(self.trace_, X_scaled.values)
+    @profiled("predict")
+    def predict(
+        self, X, ci_percentiles=None, max_memory=None, include_noise=False, n_noise=None, random_seed=None,
+        dtype=None,
+    ):
+        """
+        Predicts ``X`` with the fitted trace. Returns the posterior mean as ``yhat`` and a
+        ``percentile_<p>`` column for each of ``ci_percentiles``.
+
+        By default the percentiles only reflect the uncertainty of the parameters. With
+        ``include_noise`` they are taken over the posterior predictive distribution instead:
+        observation noise from the likelihood is added to every draw, ``n_noise`` samples
+        per draw (by default enough for 1000 samples per row), using a generator seeded with
+        ``random_seed``. The noise doesn't change the mean, so ``include_noise`` needs
+        ``ci_percentiles``.
+
+        With ``max_memory`` (in bytes), rows and posterior draws are processed in blocks so
+        that the prediction matrices stay roughly within the budget. The mean is accumulated
+        over draw blocks, percentiles need every draw of a row, so when they are requested
+        only the rows are split.
+
+        The prediction matrices are computed in ``dtype``, e.g. ``"float32"`` to halve their
+        memory, by default the float dtype of ``usopp.config``. The returned columns are
+        float64.
+        """
+        if include_noise and ci_percentiles is None:
+            raise ValueError("include_noise needs ci_percentiles, the noise doesn't change yhat")
+        dtype = np.dtype(dtype or get_float_dtype())
+        with profile("scale"):
+            X_scaled = self._scale(X)
+
+        n_rows = len(X_scaled)
+        n_chains, n_draws = get_draw_shape(self.trace_)
+        plan = list(self._plan())
+        itemsize = dtype.itemsize
+        if include_noise:
+            rng = np.random.default_rng(random_seed)
+            noise_group = self._likelihood_._group_codes(X_scaled)
+            if n_noise is None:
+                n_noise = -(-1000 // (n_chains * n_draws))
+        else:
+            n_noise = 1
+        if max_memory is None:
+            row_block, draw_block = n_rows, n_draws
+        else:
+            row_block, draw_block = _block_shape(
+                n_rows, n_chains, n_draws * n_noise, max_memory // (itemsize * (_plan_width(plan) + 4)),
+                split_draws=ci_percentiles is None,
+            )
+            draw_block = min(draw_block, n_draws)
+
+        mean = np.zeros(n_rows)
+        percentiles = None if ci_percentiles is None else np.empty((len(ci_percentiles), n_rows))
+        # a row block is evaluated once unless its draws are split, its bases would only
+        # evict the ones of whole frames from the caches
+        blocks_once = row_block < n_rows and draw_block == n_draws
+        with uncached_bases() if blocks_once else nullcontext():
+            for row_start in range(0, n_rows, row_block):
+                rows = slice(row_start, row_start + row_block)
+                for draw_start in range(0, n_draws, draw_block):
+                    trace = slice_draws(self.trace_, draw_start, draw_start + draw_block)
+                    with profile("components"):
+                        y_hat_scaled = _run_plan(plan, trace, X_scaled.rows(rows), dtype=dtype)
+                    with profile("summarize"):
+                        y_hat = self._y_scaler_.inv_transform(y_hat_scaled)
+                        if draw_block == n_draws:
+                            mean[rows] = y_hat.mean(axis=1)
+                        else:
+                            mean[rows] += y_hat.sum(axis=1) / (n_chains * n_draws)
+                    if include_noise:
+                        with profile("noise"):
+                            y_hat = self._y_scaler_.inv_transform(
+                                self._likelihood_.sample(
+                                    y_hat_scaled, trace, rng, n_noise,
+                                    group=None if noise_group is None else noise_group[rows],
+                                )
+                            )
+                    if percentiles is not None:
+                        with profile("summarize"):
+                            percentiles[:, rows] = np.percentile(y_hat, ci_percentiles, axis=1)
 
-        # TODO: We only take the uncertainty of the parameters here, still need to add the uncertainty
-        # from the likelihood as well
-
-        y_hat = self._y_scaler_.inv_transform(y_hat_scaled)
-        mean = y_hat.mean(axis=1)
         result = pd.DataFrame(mean, index=X.index, columns=["yhat"])
         if ci_percentiles is not None:
-            percentiles = np.percentile(y_hat, ci_percentiles, axis=1)
             for i, percentile in enumerate(ci_percentiles):
                 result[f"percentile_{percentile}"] = percentiles[i]
         return result
 
+    def predict_iter(self, chunks, n_workers=1, batch_size=65_536, columns=None, **predict_kwargs):
+        """
+        Predicts a stream of rows chunk by chunk and yields the prediction of every chunk,
+        in order. ``chunks`` is an iterable of DataFrames, or the path of a parquet file or
+        directory, read in chunks of ``batch_size`` rows with only ``columns`` if given.
+
+        With ``n_workers`` above 1, chunks are predicted in that many threads, the NumPy
+        products release the GIL. At most ``n_workers + 1`` chunks are in flight, so
+        memory stays bounded by the chunk size, together with ``max_memory`` of
+        ``predict_kwargs`` within a chunk. Each chunk gets its own noise generator, spawned
+        from ``random_seed``. ``usopp.streaming.write_parquet`` writes the predictions out.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if isinstance(chunks, (str, os.PathLike)):
+            from usopp.streaming import iter_parquet
+
+            chunks = iter_parquet(chunks, batch_size=batch_size, columns=columns)
+        seed = np.random.SeedSequence(predict_kwargs.pop("random_seed", None))
+
+        if n_workers == 1:
+            for chunk in chunks:
+                yield self.predict(chunk, random_seed=seed.spawn(1)[0], **predict_kwargs)
+            return
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(self.predict, chunk, random_seed=seed.spawn(1)[0], **predict_kwargs))
+                if len(pending) > n_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
     @abstractmethod
-    def _predict(self, trace, X):
+    def _predict(self, trace, X, pool_group=None):
         pass
 
+    def _plan(self):
+        """
+        Yields the instructions that evaluate the model with ``_run_plan``: ``("predict",
+        component)`` pushes the prediction of a component, ``("add", right_first)`` and
+        ``("multiply", right_first)`` combine the two topmost predictions, of which the
+        right operand is the lower one if ``right_first``.
+        """
+        yield "predict", self
+
+    def _call(self, method, *args, **kwargs):
+        """Calls ``method`` of this component, recorded as a phase named after the component."""
+        with profile(self.name):
+            return getattr(self, method)(*args, **kwargs)
+
     @abstractmethod
     def plot(self, trace, t, y_scaler):
         pass
@@ -99,6 +483,76 @@ class TimeSeriesModel(ABC):
     def _param_name(self, param):
         return f"{self.name}-{param}"
 
+    def _components(self):
+        """Yields the leaf components of the model."""
+        yield self
+
+    def _trace_names(self):
+        """Returns the names of the trace variables needed for prediction."""
+        names = [
+            component._param_name(param) for component in self._components() for param in component._predict_params
+        ]
+        return names + list(self._likelihood_._predict_params)
+
+    def _group_layout(self, X):
+        """Returns the group layout of ``X``, shared with the other components during ``fit``."""
+        context = FitContext.get_context()
+        if context is not None and context.X is X:
+            return context.layout(self.pool_cols, self.pool_type)
+        return group_layout(X, self.pool_cols, self.pool_type)
+
+    def _group_definition(self, X):
+        layout = self._group_layout(X)
+        self.groups_ = layout.groups
+        return layout.n_groups
+
+    def _group_codes(self, X):
+        if self.pool_type == 'complete':
+            return np.zeros(len(X), dtype='int')
+        context = FitContext.get_context()
+        if context is not None and context.X is X:
+            return context.layout(self.pool_cols, self.pool_type).codes
+        return get_group_codes(X[self.pool_cols], self.groups_)
+
+    @staticmethod
+    def _custom_ops():
+        """Whether the graph of the current ``fit`` may use the ops of ``usopp.ops``."""
+        context = FitContext.get_context()
+        return context is None or context.custom_ops
+
+    def _segment_dot(self, M, W, group):
+        """Returns ``sum(M * W[group], axis=1)`` in the model graph."""
+        from usopp.ops import segment_dot
+
+        return segment_dot(M, W, group, complete=self.pool_type == 'complete', custom_ops=self._custom_ops())
+
+    def _design(self, X):
+        """Returns the row aligned arrays the component registers as data containers."""
+        raise NotImplementedError(f"{type(self).__name__} does not register its data and can't be refit")
+
+    def _register_data(self, model, design):
+        import pymc as pm
+
+        with model:
+            return {name: pm.Data(self._param_name(name), value) for name, value in design.items()}
+
+    def _get_t(self, X):
+        """Returns the scaled time of the ``Columns`` ``X``, or ``X`` if it is an array of times."""
+        if isinstance(X, np.ndarray):
+            return X
+        return np.asarray(X["t"], dtype=get_float_dtype())
+
+    def _get_pool_group(self, X, pool_group=None):
+        """
+        Returns ``pool_group`` if given, otherwise the group code of each row of ``X``.
+        Completely pooled components only have group 0.
+        """
+        if pool_group is not None:
+            return pool_group
+        if self.pool_type == 'complete':
+            return 0
+        return get_group_codes(X[self.pool_cols], self.groups_)
+
     def __add__(self, other):
         return AdditiveTimeSeries(self, other)
 
@@ -108,6 +562,80 @@ class TimeSeriesModel(ABC):
     def __str__(self):
         return self.name
 
+    def __getstate__(self):
+        # the PyMC model and its compiled functions are rebuilt by the next fit
+        return {key: value for key, value in self.__dict__.items() if key not in ("_model_", "_map_optimizer_")}
+
+
+def _block_shape(n_rows, n_chains, n_draws, max_cells, split_draws):
+    """
+    Returns the number of rows and draws per block so that a block has at most
+    ``max_cells`` entries. Draws are only split when ``split_draws`` and a single
+    row with all draws does not fit.
+    """
+    n_samples = n_chains * n_draws
+    if not split_draws or max_cells >= n_samples:
+        return max(1, max_cells // n_samples), n_draws
+    row_block = min(n_rows, max(1, max_cells // n_chains))
+    return row_block, max(1, max_cells // (row_block * n_chains))
+
+
+def _run_plan(plan, trace, X, pool_group=None, dtype=None):
+    """
+    Evaluates the instructions of ``TimeSeriesModel._plan`` on a stack. Predictions are
+    combined in place into the one below them, so only the predictions of a component and
+    of the unfinished right branches are alive at the same time instead of a temporary
+    per node. With ``dtype`` the predictions are combined in that dtype.
+    """
+    stack = []
+    for instruction, argument in plan:
+        if instruction == "predict":
+            stack.append(np.asarray(argument._call("_predict", trace, X, pool_group), dtype=dtype))
+            continue
+        right, left = stack.pop(), stack.pop()
+        if argument:
+            left, right = right, left
+        if instruction == "multiply":
+            right = _combine(np.add, right, 1)
+            stack.append(_combine(np.multiply, left, right))
+        else:
+            stack.append(_combine(np.add, left, right))
+        # drop the references to the operands so that the consumed one can be freed
+        del left, right
+    return stack.pop()
+
+
+def _binary_plan(instruction, left, right):
+    """
+    Yields the plan of ``left`` and ``right`` combined with ``instruction``. The operand
+    that needs more predictions alive is evaluated first, which keeps the width of the
+    plan at its minimum.
+    """
+    left, right = list(left._plan()), list(right._plan())
+    right_first = _plan_width(right) > _plan_width(left)
+    yield from right + left if right_first else left + right
+    yield instruction, right_first
+
+
+def _plan_width(plan):
+    """Returns the largest number of predictions alive at once while running ``plan``."""
+    width = size = 0
+    for instruction, _ in plan:
+        size += 1 if instruction == "predict" else -1
+        width = max(width, size)
+    return width
+
+
+def _combine(ufunc, left, right):
+    """Returns ``ufunc(left, right)``, written into ``left`` when its shape and dtype allow."""
+    right = np.asarray(right)
+    if (
+        left.flags.writeable and left.shape == np.broadcast_shapes(left.shape, right.shape)
+        and np.can_cast(np.result_type(left, right), left.dtype, casting="same_kind")
+    ):
+        return ufunc(left, right, out=left)
+    return ufunc(left, right)
+
 
 class AdditiveTimeSeries(TimeSeriesModel):
     def __init__(self, left, right):
@@ -115,21 +643,28 @@ class AdditiveTimeSeries(TimeSeriesModel):
         self.right = right
         super().__init__()
 
+    def _components(self):
+        yield from self.left._components()
+        yield from self.right._components()
+
+    def _call(self, method, *args, **kwargs):
+        return getattr(self, method)(*args, **kwargs)
+
     def definition(self, *args, **kwargs):
-        return self.left.definition(*args, **kwargs) + self.right.definition(
-            *args, **kwargs
+        return self.left._call("definition", *args, **kwargs) + self.right._call(
+            "definition", *args, **kwargs
         )
 
     def plot(self, *args, **kwargs):
-        left = self.left.plot(*args, **kwargs)
-        right = self.right.plot(*args, **kwargs)
+        left = self.left._call("plot", *args, **kwargs)
+        right = self.right._call("plot", *args, **kwargs)
         return left + right
 
-    def _predict(self, trace, x_scaled):
-        return (
-            self.left._predict(trace, x_scaled) +
-            self.right._predict(trace, x_scaled)
-        )
+    def _plan(self):
+        yield from _binary_plan("add", self.left, self.right)
+
+    def _predict(self, trace, x_scaled, pool_group=None):
+        return _run_plan(self._plan(), trace, x_scaled, pool_group)
 
     def __repr__(self):
         return (
@@ -146,20 +681,27 @@ class MultiplicativeTimeSeries(TimeSeriesModel):
         self.right = right
         super().__init__()
 
+    def _components(self):
+        yield from self.left._components()
+        yield from self.right._components()
+
+    def _call(self, method, *args, **kwargs):
+        return getattr(self, method)(*args, **kwargs)
+
     def definition(self, *args, **kwargs):
-        return self.left.definition(*args, **kwargs) * (
-            1 + self.right.definition(*args, **kwargs)
+        return self.left._call("definition", *args, **kwargs) * (
+            1 + self.right._call("definition", *args, **kwargs)
         )
 
-    def _predict(self, trace, x_scaled):
-        return (
-            self.left._predict(trace, x_scaled) *
-            (1 + self.right._predict(trace, x_scaled))
-        )
+    def _plan(self):
+        yield from _binary_plan("multiply", self.left, self.right)
+
+    def _predict(self, trace, x_scaled, pool_group=None):
+        return _run_plan(self._plan(), trace, x_scaled, pool_group)
 
     def plot(self, *args, **kwargs):
-        left = self.left.plot(*args, **kwargs)
-        right = self.right.plot(*args, **kwargs)
+        left = self.left._call("plot", *args, **kwargs)
+        right = self.right._call("plot", *args, **kwargs)
         return left + (left * right)
 
     def __repr__(self):
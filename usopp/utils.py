@@ -1,13 +1,139 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 import pandas as pd
 
+from usopp.config import get_float_dtype
+
 
 def dot(a, b):
     return (a * b[None, :]).sum(axis=-1)
 
 
+class BasisCache:
+    """
+    Least recently used cache for design matrices, keyed on the time vector they are
+    computed from. The matrices and time vectors kept take at most ``max_bytes``, larger
+    ones aren't cached. Safe to share between threads.
+    """
+    def __init__(self, max_bytes=128 * 2**20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, t, build):
+        """
+        Returns ``build(t)`` in the float dtype, reusing the matrix of an earlier call with
+        an equal ``t``. A float ``t`` is passed to ``build`` in float64. Within
+        ``uncached_bases`` the matrix is built without looking at the cache.
+        """
+        dtype = get_float_dtype()
+        cached = not getattr(_uncached, "active", False)
+        if cached:
+            key = (t.shape, t.dtype.str, dtype.str, hash(t.tobytes()))
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and np.array_equal(entry[0], t):
+                    self._entries.move_to_end(key)
+                    return entry[1]
+
+        basis = build(t.astype(np.float64) if t.dtype.kind == "f" else t)
+        if isinstance(basis, np.ndarray):
+            basis = basis.astype(dtype, copy=False) if basis.dtype.kind == "f" else basis
+            basis.flags.writeable = False
+            nbytes = basis.nbytes
+        else:
+            # scipy sparse matrix, cast in place as astype drops explicitly stored zeros
+            basis.data = basis.data.astype(dtype, copy=False)
+            nbytes = basis.data.nbytes + basis.indices.nbytes + basis.indptr.nbytes
+        nbytes += t.nbytes
+        if cached and nbytes <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = (t.copy(), basis, nbytes)
+                    self._nbytes += nbytes
+                while self._nbytes > self.max_bytes:
+                    self._nbytes -= self._entries.popitem(last=False)[1][2]
+        return basis
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __getstate__(self):
+        # cached matrices are cheap to rebuild, don't carry them around
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+_uncached = threading.local()
+
+
+@contextmanager
+def uncached_bases():
+    """Within the context, ``BasisCache.get`` builds the matrices of this thread without caching them."""
+    previous = getattr(_uncached, "active", False)
+    _uncached.active = True
+    try:
+        yield
+    finally:
+        _uncached.active = previous
+
+
+class Columns:
+    """
+    The columns of a frame the components work on, keyed by name: NumPy arrays, and
+    pandas Categoricals for categorical columns. ``len`` is the number of rows.
+    """
+    def __init__(self, columns, n_rows):
+        self._columns = columns
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_frame(cls, X):
+        """Returns the columns of the DataFrame ``X``, sharing its memory where pandas allows."""
+        return cls({name: _column_values(X[name]) for name in X.columns}, len(X))
+
+    def rows(self, index):
+        """Returns the rows ``index`` of every column, views for a slice."""
+        columns = {name: values[index] for name, values in self._columns.items()}
+        return Columns(columns, len(next(iter(columns.values()))) if columns else 0)
+
+    def assign(self, **columns):
+        return Columns({**self._columns, **columns}, self.n_rows)
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return self.n_rows
+
+
+def _column_values(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.array
+    return series.to_numpy()
+
+
+class Posterior(dict):
+    """
+    Posterior samples keyed by variable name, with the draws of all chains flattened on
+    the leading axis. A MAP estimate is stored as a single draw.
+    """
+
+
 class IdentityScaler:
     def fit(self, data):
         self.scale_factor_ = 1
@@ -41,7 +167,7 @@ class MinMaxScaler:
         return self
 
     def transform(self, series):
-        return ((series - self.min_) / self.scale_factor_).astype("float")
+        return ((series - self.min_) / self.scale_factor_).astype(get_float_dtype())
 
     def fit_transform(self, series):
         self.fit(series)
@@ -62,7 +188,7 @@ class MaxScaler:
         return self
 
     def transform(self, series):
-        return series / self.scale_factor_
+        return (series / self.scale_factor_).astype(get_float_dtype())
 
     def fit_transform(self, series):
         self.fit(series)
@@ -81,7 +207,7 @@ class StdScaler:
         return self
 
     def transform(self, series):
-        return (series - self.mean_) / self.std_
+        return ((series - self.mean_) / self.std_).astype(get_float_dtype())
 
     def fit_transform(self, series):
         self.fit(series)
@@ -92,6 +218,8 @@ class StdScaler:
 
 
 def add_subplot(height=5):
+    import matplotlib.pyplot as plt
+
     fig = plt.gcf()
     n = len(fig.axes)
     for i in range(n):
@@ -108,6 +236,8 @@ class Drawer():
 
         Note that subplots are added to the bottom.
         """
+        import matplotlib.pyplot as plt
+
         self.fig = plt.figure()
 
         # Start with one subplot
@@ -115,6 +245,8 @@ class Drawer():
 
     def add_subplot(self) -> None:
         """Plots the data to a new subplot at the bottom."""
+        import matplotlib.gridspec as gridspec
+
         self.row += 1
         gs = gridspec.GridSpec(self.row, 1)
 
@@ -128,13 +260,15 @@ class Drawer():
         return new_ax
 
     def show(self) -> None:
+        import matplotlib.pyplot as plt
+
         plt.show()
 
 
-def trend_data(n_changepoints, location="spaced", noise=0.001):
+def trend_data(n_changepoints, location="spaced", noise=0.001, n_obs=1000):
     delta = np.random.laplace(size=n_changepoints)
 
-    t = np.linspace(0, 1, 1000)
+    t = np.linspace(0, 1, n_obs)
 
     if location == "random":
         s = np.sort(np.random.choice(t, n_changepoints, replace=False))
@@ -158,11 +292,11 @@ def trend_data(n_changepoints, location="spaced", noise=0.001):
     )
 
 
-def logistic_growth_data(n_changepoints, location="spaced", noise=0.001, loc=0, scale=0.2):
+def logistic_growth_data(n_changepoints, location="spaced", noise=0.001, loc=0, scale=0.2, n_obs=1000):
     delta = np.random.laplace(size=n_changepoints, loc=loc, scale=scale)
     gamma = np.zeros(n_changepoints)
 
-    t = np.linspace(0, 1, 1000)
+    t = np.linspace(0, 1, n_obs)
     if location == "random":
         s = np.sort(np.random.choice(t, n_changepoints, replace=False))
     elif location == "spaced":
@@ -186,12 +320,12 @@ def logistic_growth_data(n_changepoints, location="spaced", noise=0.001, loc=0,
     )
 
 
-def seasonal_data(n_components, noise=0.001):
+def seasonal_data(n_components, noise=0.001, n_obs=1000):
     def X(t, p=365.25, n=10):
         x = 2 * np.pi * (np.arange(n) + 1) * t[:, None] / p
         return np.concatenate((np.cos(x), np.sin(x)), axis=1)
 
-    t = np.linspace(0, 1, 1000)
+    t = np.linspace(0, 1, n_obs)
     beta = np.random.normal(size=2 * n_components)
 
     seasonality = X(t, 365.25 / len(t), n_components) @ beta + np.random.randn(len(t)) * noise
@@ -228,8 +362,8 @@ def rbf_seasonal_data(n_components, sigma=0.015, noise=0.001):
     )
 
 
-def regressor_data(n_features, loc=0., scale=1., noise=0.001, binary=False):
-    t = np.linspace(0, 1, 1000)
+def regressor_data(n_features, loc=0., scale=1., noise=0.001, binary=False, n_obs=1000):
+    t = np.linspace(0, 1, n_obs)
 
     k = np.random.normal(loc, scale, size=(n_features))
     if binary:
@@ -288,12 +422,86 @@ def get_group_definition(X, pool_cols, pool_type):
         group_mapping = {0: 'all'}
         n_groups = 1
     else:
-        group = X[pool_cols].cat.codes.values
-        group_mapping = dict(enumerate(X[pool_cols].cat.categories))
-        n_groups = X[pool_cols].nunique()
+        pool = pd.Categorical(X[pool_cols])
+        group = pool.codes
+        group_mapping = dict(enumerate(pool.categories))
+        # unused categories get parameters too, so every code indexes them
+        n_groups = len(pool.categories)
     return group, n_groups, group_mapping
 
 
+def get_group_codes(pool, groups):
+    """
+    Maps the pool column values of each row to the group codes learned in ``definition``.
+    """
+    codes = pd.Categorical(pool, categories=list(groups.values())).codes
+    if (codes < 0).any():
+        unknown = set(pd.unique(np.asarray(pool)[codes < 0]))
+        raise ValueError(f"pool column contains groups that were not seen during fit: {unknown}")
+    return codes
+
+
+def get_posterior(trace, name):
+    """
+    Returns the samples of ``name`` with the draws on the leading axis. Chains and draws
+    of an MCMC trace are flattened, a MAP estimate is returned as a single draw.
+    """
+    if isinstance(trace, Posterior):
+        return trace[name]
+    if isinstance(trace, dict):
+        return np.asarray(trace[name])[None, ...]
+    values = trace[name].values
+    return values.reshape(-1, *values.shape[2:])
+
+
+def get_draw_shape(trace):
+    """Returns the number of chains and draws per chain of ``trace``, a MAP estimate is a single draw."""
+    if isinstance(trace, Posterior):
+        return 1, len(next(iter(trace.values())))
+    if isinstance(trace, dict):
+        return 1, 1
+    return trace.sizes["chain"], trace.sizes["draw"]
+
+
+def slice_draws(trace, start, stop):
+    """Returns the draws ``start:stop`` of every chain in ``trace``."""
+    if isinstance(trace, Posterior):
+        return Posterior({name: values[start:stop] for name, values in trace.items()})
+    if isinstance(trace, dict):
+        return trace
+    return trace.isel(draw=slice(start, stop))
+
+
+def take_group(param, pool_group):
+    """
+    Selects the samples of a grouped parameter of shape ``(n_draws, n_groups, ...)``.
+
+    ``pool_group`` is either a single group code, in which case the result has shape
+    ``(1, n_draws, ...)``, or an array with the group code of each row, in which case
+    the result has shape ``(n_rows, n_draws, ...)``.
+    """
+    if np.ndim(pool_group) == 0:
+        return param[None, :, pool_group]
+    return np.swapaxes(param[:, pool_group], 0, 1)
+
+
+def group_dot(X, param, pool_group):
+    """
+    Row-wise dot product of ``X`` with shape ``(n_rows, n_params)``, dense or a scipy CSR
+    matrix, and the samples of a grouped parameter with shape ``(n_draws, n_groups,
+    n_params)``. Returns an array of shape ``(n_rows, n_draws)``.
+    """
+    if np.ndim(pool_group) == 0:
+        return np.asarray(X @ param[:, pool_group, :].T)
+    # one product per group, so that param is never gathered for every row
+    out = np.empty((X.shape[0], param.shape[0]), dtype=np.result_type(X.dtype, param.dtype))
+    order = np.argsort(pool_group, kind="stable")
+    groups, starts = np.unique(pool_group[order], return_index=True)
+    for group, rows in zip(groups, np.split(order, starts[1:])):
+        out[rows] = X[rows] @ param[:, group, :].T
+    return out
+
+
 def get_periodic_peaks(
         n: int = 20,
         period: pd.Timedelta = pd.Timedelta(days=365.25)):